@@ -0,0 +1,249 @@
+"""Token and cost accounting with per-run and per-day budgets"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+from config import (
+    BUDGET_DAY_COST,
+    BUDGET_DAY_TOKENS,
+    BUDGET_ESTIMATE_COMPLETION_TOKENS,
+    BUDGET_ESTIMATE_PROMPT_TOKENS,
+    BUDGET_RUN_COST,
+    BUDGET_RUN_TOKENS,
+    BUDGET_SOFT_RATIO,
+    PRICE_INPUT_PER_MILLION,
+    PRICE_OUTPUT_PER_MILLION,
+    USAGE_LEDGER_PATH,
+)
+
+# 预算状态
+BUDGET_NORMAL = "normal"  # 正常处理
+BUDGET_ECONOMY = "economy"  # 接近上限：降低 DPI、换用便宜模型、跳过空白页
+BUDGET_EXHAUSTED = "exhausted"  # 已达上限：停止发送新请求
+
+
+class BudgetExceeded(Exception):
+    """预算已用完"""
+
+
+@contextmanager
+def _locked(lock_path: Path) -> Iterator[None]:
+    """持有 lock_path 上的操作系统文件锁（阻塞等待），用于多个进程之间互斥"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍失败时抛出 OSError，继续等待
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    requests: int = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        self.requests += 1
+
+
+class BudgetTracker:
+    """统计 token 用量和费用，并根据预算给出当前应采用的处理策略
+
+    单次运行的用量在 start_run() 时清零；当天的用量记录在 ledger_path 中，跨运行累计。
+    命令行、监听目录、HTTP 服务和 GUI 默认共用同一个 ledger，更新时持有文件锁，同时运行的进程不会互相覆盖。
+    所有上限为 0 表示不限制。用量达到任一上限的 soft_ratio 时进入 economy 状态。
+    check() 为每个即将发送的请求预留预估用量，record()/release() 时结算，
+    并发请求不会在任何用量记录之前全部通过检查；其他进程进行中的请求不计入。
+    """
+
+    def __init__(
+        self,
+        run_tokens: int = BUDGET_RUN_TOKENS,
+        run_cost: float = BUDGET_RUN_COST,
+        day_tokens: int = BUDGET_DAY_TOKENS,
+        day_cost: float = BUDGET_DAY_COST,
+        soft_ratio: float = BUDGET_SOFT_RATIO,
+        price_input: float = PRICE_INPUT_PER_MILLION,
+        price_output: float = PRICE_OUTPUT_PER_MILLION,
+        ledger_path: Optional[str] = USAGE_LEDGER_PATH,
+        pause_when_exhausted: bool = False,
+    ):
+        self.run_tokens = run_tokens
+        self.run_cost = run_cost
+        self.day_tokens = day_tokens
+        self.day_cost = day_cost
+        self.soft_ratio = soft_ratio
+        self.price_input = price_input
+        self.price_output = price_output
+        self.ledger_path = Path(ledger_path) if ledger_path else None
+        # 当日预算用完时是否等待到第二天继续（单次运行预算用完时总是停止）
+        self.pause_when_exhausted = pause_when_exhausted
+        self.run_usage = Usage()
+        self.per_file: dict[str, Usage] = {}
+        # 已通过 check() 但还没有 record()/release() 的请求数
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        # 有请求结算（record()/release()）时通知在 check() 中等待的线程
+        self._settled = threading.Condition(self._lock)
+
+    def start_run(self) -> None:
+        with self._lock:
+            self.run_usage = Usage()
+            self.per_file = {}
+
+    def cost_of(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.price_input + completion_tokens * self.price_output) / 1_000_000
+
+    def record(self, filename: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """记录一次请求的用量，返回本次费用"""
+        cost = self.cost_of(prompt_tokens, completion_tokens)
+        with self._lock:
+            self.run_usage.add(prompt_tokens, completion_tokens, cost)
+            self.in_flight = max(0, self.in_flight - 1)
+            self._settled.notify_all()
+            self.per_file.setdefault(filename, Usage()).add(prompt_tokens, completion_tokens, cost)
+            if self.ledger_path is not None:
+                # 读-改-写必须在文件锁内完成，否则其他进程在此期间写入的用量会被覆盖
+                with _locked(self.ledger_path.with_name(f"{self.ledger_path.name}.lock")):
+                    ledger = self._load_ledger()
+                    today = ledger.setdefault(date.today().isoformat(), asdict(Usage()))
+                    today["prompt_tokens"] += prompt_tokens
+                    today["completion_tokens"] += completion_tokens
+                    today["cost"] += cost
+                    today["requests"] += 1
+                    self._save_ledger(ledger)
+        return cost
+
+    def release(self) -> None:
+        """check() 之后没有发送请求或请求失败时调用，释放预留的用量"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._settled.notify_all()
+
+    def day_usage(self) -> Usage:
+        if self.ledger_path is None:
+            return Usage()
+        with self._lock:
+            return Usage(**self._load_ledger().get(date.today().isoformat(), {}))
+
+    def _ratios(self) -> tuple[float, float]:
+        """返回 (单次运行已用比例, 当日已用比例)，包括进行中请求的预留用量，取 token 和费用中较大者；需持有 _lock"""
+
+        def ratio(used: float, limit: float) -> float:
+            return used / limit if limit > 0 else 0.0
+
+        if self.run_usage.requests:
+            prompt_tokens = self.run_usage.prompt_tokens / self.run_usage.requests
+            completion_tokens = self.run_usage.completion_tokens / self.run_usage.requests
+        else:
+            prompt_tokens, completion_tokens = BUDGET_ESTIMATE_PROMPT_TOKENS, BUDGET_ESTIMATE_COMPLETION_TOKENS
+        reserved_tokens = self.in_flight * (prompt_tokens + completion_tokens)
+        reserved_cost = self.in_flight * self.cost_of(prompt_tokens, completion_tokens)
+
+        day = Usage()
+        if self.ledger_path is not None:
+            day = Usage(**self._load_ledger().get(date.today().isoformat(), {}))
+        run_ratio = max(
+            ratio(self.run_usage.tokens + reserved_tokens, self.run_tokens),
+            ratio(self.run_usage.cost + reserved_cost, self.run_cost),
+        )
+        day_ratio = max(
+            ratio(day.tokens + reserved_tokens, self.day_tokens),
+            ratio(day.cost + reserved_cost, self.day_cost),
+        )
+        return run_ratio, day_ratio
+
+    def _level_of(self, used: float) -> str:
+        if used >= 1:
+            return BUDGET_EXHAUSTED
+        if used >= self.soft_ratio:
+            return BUDGET_ECONOMY
+        return BUDGET_NORMAL
+
+    def level(self) -> str:
+        """当前预算状态: normal / economy / exhausted"""
+        with self._lock:
+            return self._level_of(max(self._ratios()))
+
+    def check(self) -> str:
+        """发送请求前调用：为这次请求预留用量并返回预算状态，之后必须调用 record() 或 release() 结算
+
+        检查和预留在同一把锁内完成，同时发出的请求依次看到彼此的预留用量。
+        加上预留用量后超出上限时，等待进行中的请求结算后按实际用量重新判断；
+        实际用量已用完时不预留，按配置等待到第二天或抛出 BudgetExceeded。
+        """
+        with self._settled:
+            while True:
+                run_ratio, day_ratio = self._ratios()
+                level = self._level_of(max(run_ratio, day_ratio))
+                if level != BUDGET_EXHAUSTED:
+                    self.in_flight += 1
+                    return level
+                if self.in_flight == 0:
+                    break
+                self._settled.wait()
+        if not self.pause_when_exhausted or run_ratio >= 1:
+            raise BudgetExceeded("预算已用完，跳过剩余页面")
+        tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        print(f"当日预算已用完，暂停到 {tomorrow:%Y-%m-%d %H:%M}")
+        while datetime.now() < tomorrow:
+            time.sleep(min(60.0, max(1.0, (tomorrow - datetime.now()).total_seconds())))
+        return self.check()
+
+    def summary(self) -> dict:
+        """本次运行的用量汇总，包括每个文件的用量"""
+        with self._lock:
+            per_file = {name: {**asdict(usage), "cost": round(usage.cost, 6)} for name, usage in self.per_file.items()}
+            run = {**asdict(self.run_usage), "cost": round(self.run_usage.cost, 6)}
+        day = self.day_usage()
+        return {"run": run, "day": {**asdict(day), "cost": round(day.cost, 6)}, "files": per_file}
+
+    def _load_ledger(self) -> dict:
+        try:
+            return json.loads(self.ledger_path.read_text(encoding="utf-8"))  # type: ignore[union-attr]
+        except (OSError, ValueError):
+            return {}
+
+    def _save_ledger(self, ledger: dict) -> None:
+        assert self.ledger_path is not None
+        self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.ledger_path.with_name(f"{self.ledger_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(ledger, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.ledger_path)
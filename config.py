@@ -23,9 +23,32 @@ dotenv.load_dotenv(env_path)
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL") or "deepseek-chat"
+# 多个 API key（逗号分隔），用于分布式模式下每个 worker 使用独立的 key
+DEEPSEEK_API_KEYS = [key.strip() for key in (os.getenv("DEEPSEEK_API_KEYS") or "").split(",") if key.strip()]
+# 预算接近上限时改用的便宜模型，未设置时继续使用 DEEPSEEK_MODEL
+DEEPSEEK_ECONOMY_MODEL = os.getenv("DEEPSEEK_ECONOMY_MODEL") or DEEPSEEK_MODEL
+
+# Budget Configuration (0 = unlimited)
+PRICE_INPUT_PER_MILLION = float(os.getenv("PRICE_INPUT_PER_MILLION") or 2.0)  # 元 / 百万输入 token
+PRICE_OUTPUT_PER_MILLION = float(os.getenv("PRICE_OUTPUT_PER_MILLION") or 3.0)  # 元 / 百万输出 token
+BUDGET_RUN_TOKENS = int(os.getenv("BUDGET_RUN_TOKENS") or 0)
+BUDGET_RUN_COST = float(os.getenv("BUDGET_RUN_COST") or 0)
+BUDGET_DAY_TOKENS = int(os.getenv("BUDGET_DAY_TOKENS") or 0)
+BUDGET_DAY_COST = float(os.getenv("BUDGET_DAY_COST") or 0)
+BUDGET_SOFT_RATIO = 0.8  # 用量达到上限的该比例时切换到省钱模式
+# 本次运行还没有完成的请求时，每个进行中的请求预留的输入/输出 token 数；之后按已完成请求的平均用量预留
+BUDGET_ESTIMATE_PROMPT_TOKENS = int(os.getenv("BUDGET_ESTIMATE_PROMPT_TOKENS") or 2000)
+BUDGET_ESTIMATE_COMPLETION_TOKENS = int(os.getenv("BUDGET_ESTIMATE_COMPLETION_TOKENS") or 500)
+ECONOMY_DPI = 120  # 省钱模式下发送给 API 的图片 DPI
+USAGE_LEDGER_PATH = os.getenv("USAGE_LEDGER_PATH") or str(Path.home() / ".invoice-tools" / "usage.json")
 
 # Processing Configuration
 MAX_WORKERS = 5  # Concurrent processing threads
+PAGE_WORKERS = 5  # Concurrent pages per PDF
+DEFAULT_DPI = 200  # PDF rasterization DPI
+# 识别前先在本地检测页面上的发票区域并分别裁剪（一页多张票据、大片空白时减少图片 token），设为 0 时发送整页
+REGION_DETECTION = (os.getenv("REGION_DETECTION") or "1") != "0"
 
 # Default paths
 DEFAULT_OUTPUT_FILENAME = "发票信息统计.xlsx"
+DEFAULT_STORE_FILENAME = "invoices.db"
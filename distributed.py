@@ -0,0 +1,539 @@
+"""Multi-process / multi-node work distribution over a shared SQLite page queue
+
+协调者把每个PDF拆成页级任务写入共享的 SQLite 队列，多个 worker 进程（可以在不同机器上，
+通过共享目录访问队列、PDF和结果缓存）各自使用自己的 API 凭据和速率限制领取任务。
+worker 崩溃时任务租约过期后会被其他 worker 重新领取。
+
+用法:
+    # 单机多进程，每个 worker 使用 DEEPSEEK_API_KEYS 中的一个 key
+    python distributed.py run ~/发票/ -o 发票信息统计.xlsx --queue /shared/queue.db --local-workers 3
+
+    # 其他机器上加入同一个队列
+    DEEPSEEK_API_KEY=sk-xxx python distributed.py worker --queue /shared/queue.db --cache-dir /shared/cache
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Optional
+
+from budget import BUDGET_ECONOMY, BudgetTracker
+from config import (
+    BUDGET_DAY_COST,
+    BUDGET_DAY_TOKENS,
+    DEEPSEEK_API_KEYS,
+    DEEPSEEK_BASE_URL,
+    DEEPSEEK_ECONOMY_MODEL,
+    DEEPSEEK_MODEL,
+    DEFAULT_DPI,
+    ECONOMY_DPI,
+    MAX_WORKERS,
+    REGION_DETECTION,
+)
+from financial import (
+    EXIT_OK,
+    EXIT_PARTIAL_FAILURE,
+    EXIT_USAGE,
+    OUTPUT_FORMATS,
+    REGION_LAYOUT,
+    InvoiceData,
+    InvoiceExtractor,
+    PageEvent,
+    collect_pdf_paths,
+    get_client,
+    image_to_base64,
+    invoice_from_dict,
+    is_blank_page,
+    page_regions,
+    parse_invoice_from_image,
+    pdf_page_count,
+    pdf_to_images,
+    scale_to_dpi,
+    write_output,
+)
+from result_cache import ResultCache, file_sha256
+
+# 单个任务最多尝试次数，超过后标记为失败
+MAX_ATTEMPTS = 3
+# worker 领取任务后的租约时长（秒），超时未完成的任务会被重新分配
+LEASE_SECONDS = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    file_hash TEXT NOT NULL,
+    dpi INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, lease_until);
+CREATE INDEX IF NOT EXISTS idx_tasks_run ON tasks(run_id, pdf_path);
+"""
+
+
+class TaskQueue:
+    """基于 SQLite 的页级任务队列，可被多个进程同时访问
+
+    队列文件可能放在多台机器共享的网络文件系统上，WAL 模式依赖同一台主机上的共享内存，
+    在网络文件系统上不可用，因此使用默认的回滚日志（DELETE）模式。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = str(db_path)
+        with closing(self._connect()) as conn, conn:
+            # 显式设置，把旧版本创建的 WAL 模式队列文件转换回回滚日志模式
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, run_id: str, pdf_path: str, file_hash: str, dpi: int, pages: list[int]) -> list[int]:
+        """写入一个PDF的页级任务，返回任务 id"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [
+                conn.execute(
+                    "INSERT INTO tasks (run_id, pdf_path, page_number, file_hash, dpi) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, pdf_path, page_number, file_hash, dpi),
+                ).lastrowid
+                for page_number in pages
+            ]
+            conn.execute("COMMIT")
+        return ids  # type: ignore[return-value]
+
+    def claim(self, worker: str, lease_seconds: float = LEASE_SECONDS) -> Optional[sqlite3.Row]:
+        """领取一个待处理或租约已过期的任务，没有任务时返回 None
+
+        租约过期且已达到最大尝试次数的任务（例如每次都让 worker 崩溃或卡住的页）标记为失败，不再重新分配。
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', error = ?, lease_until = NULL "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (f"租约过期 {MAX_ATTEMPTS} 次，worker 可能在处理该页时崩溃或卡住", now, MAX_ATTEMPTS),
+            )
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    (worker, now + lease_seconds, row["id"]),
+                )
+            conn.execute("COMMIT")
+        return row
+
+    def complete(self, task_id: int, worker: str, result: list[dict]) -> bool:
+        """记录结果；租约已过期、任务被其他 worker 重新领取或已结束时不修改，返回 False"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, error = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result, ensure_ascii=False), task_id, worker),
+            )
+            return cursor.rowcount > 0
+
+    def fail(self, task_id: int, worker: str, error: str) -> bool:
+        """记录失败，未超过最大尝试次数时放回队列；任务已不属于该 worker 时不修改，返回 False"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_until = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                (MAX_ATTEMPTS, error, task_id, worker),
+            )
+            return cursor.rowcount > 0
+
+    def fetch(self, task_ids: list[int]) -> list[sqlite3.Row]:
+        with closing(self._connect()) as conn:
+            placeholders = ", ".join("?" for _ in task_ids)
+            return conn.execute(f"SELECT * FROM tasks WHERE id IN ({placeholders})", task_ids).fetchall()
+
+    def purge_run(self, run_id: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM tasks WHERE run_id = ?", (run_id,))
+
+
+class RateLimiter:
+    """简单的请求速率限制，保证相邻请求间隔不小于 60 / requests_per_minute 秒"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Worker:
+    """从共享队列领取页级任务并调用 API 解析，每个 worker 使用自己的凭据和速率限制
+
+    用量记入共享的当日用量 ledger（同一台机器上的 worker 和其他命令共用），按当日预算切换省钱模式或停止；
+    单次运行预算按每个 worker 进程的生命周期计算。
+    """
+
+    def __init__(
+        self,
+        queue: TaskQueue,
+        cache_dir: Optional[str] = None,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = DEEPSEEK_BASE_URL,
+        model: str = DEEPSEEK_MODEL,
+        requests_per_minute: float = 0,
+        threads: int = 4,
+        idle_exit_seconds: Optional[float] = None,
+        detect_regions: bool = REGION_DETECTION,
+        budget: Optional[BudgetTracker] = None,
+    ):
+        self.queue = queue
+        self.cache = ResultCache(cache_dir) if cache_dir else None
+        self.client = get_client(api_key, base_url)
+        self.model = model
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.threads = threads
+        self.idle_exit_seconds = idle_exit_seconds
+        # 是否按发票区域分别识别，结果按对应的版面处理方式缓存
+        self.detect_regions = detect_regions
+        # token/费用预算，默认使用 config 中的预算配置
+        self.budget = budget or BudgetTracker()
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        """启动 threads 个线程循环领取任务，直到 stop() 或空闲超时"""
+        print(f"worker {self.name} 已启动 ({self.threads} 线程)", file=sys.stderr)
+        loops = [threading.Thread(target=self._loop, name=f"worker-{i}") for i in range(self.threads)]
+        for thread in loops:
+            thread.start()
+        for thread in loops:
+            thread.join()
+        print(f"worker {self.name} 已退出", file=sys.stderr)
+
+    def _loop(self) -> None:
+        # 按线程区分领取者，同一进程的另一个线程重新领取过期任务后，原线程的结果也不会覆盖它
+        owner = f"{self.name}/{threading.current_thread().name}"
+        idle_since = time.monotonic()
+        while not self._stop.is_set():
+            task = self.queue.claim(owner)
+            if task is None:
+                if self.idle_exit_seconds is not None and time.monotonic() - idle_since > self.idle_exit_seconds:
+                    return
+                self._stop.wait(0.5)
+                continue
+            idle_since = time.monotonic()
+            label = f"{Path(task['pdf_path']).name} 第 {task['page_number']} 页"
+            try:
+                recorded = self.queue.complete(task["id"], owner, self._process(task))
+            except Exception as e:
+                print(f"✗ {label}出错: {e}", file=sys.stderr)
+                recorded = self.queue.fail(task["id"], owner, str(e))
+            if not recorded:
+                print(f"  {label}的租约已过期并被重新分配，本次结果已丢弃", file=sys.stderr)
+
+    def _process(self, task: sqlite3.Row) -> list[dict]:
+        layout = REGION_LAYOUT if self.detect_regions else ""
+        key = ResultCache.make_key(task["file_hash"], task["page_number"], task["dpi"], self.model, layout)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        page_number = task["page_number"]
+        filename = Path(task["pdf_path"]).name
+        image = pdf_to_images(task["pdf_path"], task["dpi"], first_page=page_number, last_page=page_number)[0]
+        # 与 InvoiceExtractor 相同：check() 为请求预留用量，没有发送请求或请求失败时要 release()；
+        # 预算用完时抛出 BudgetExceeded，任务记为出错
+        economy = self.budget.check() == BUDGET_ECONOMY
+        try:
+            skip = economy and is_blank_page(image)
+            regions = [] if skip else page_regions(image, self.detect_regions)
+        except BaseException:
+            self.budget.release()
+            raise
+        if skip:
+            self.budget.release()
+            return []
+
+        result = []
+        full_quality = True
+        for region, region_image in enumerate(regions, 1):
+            if region > 1:
+                economy = self.budget.check() == BUDGET_ECONOMY
+            try:
+                model = self.model
+                if economy:
+                    region_image = scale_to_dpi(region_image, task["dpi"], ECONOMY_DPI)
+                    model = DEEPSEEK_ECONOMY_MODEL
+                    full_quality = False
+                image_base64 = image_to_base64(region_image)
+                self.rate_limiter.acquire()
+                invoice_data = parse_invoice_from_image(image_base64, client=self.client, model=model)
+            except BaseException:
+                self.budget.release()
+                raise
+            self.budget.record(filename, invoice_data.prompt_tokens, invoice_data.completion_tokens)
+            if invoice_data.is_invoice:
+                invoice_data.page_number = page_number
+                invoice_data.region = len(result) + 1
+                result.append(asdict(invoice_data))
+
+        # 省钱模式下的结果不写入按正常 DPI 和模型计算的缓存
+        if self.cache is not None and full_quality:
+            self.cache.put(key, result)
+        return result
+
+
+class DistributedExtractor(InvoiceExtractor):
+    """协调者：把页级任务写入共享队列，等待 worker 完成后汇总结果
+
+    与 InvoiceExtractor 接口相同，可直接用于 extract_to_excel / extract_to_store / sync_folder。
+    """
+
+    def __init__(
+        self,
+        queue_path: str,
+        max_workers: int = MAX_WORKERS,
+        dpi: int = DEFAULT_DPI,
+        cache_dir: Optional[str] = None,
+        poll_interval: float = 1.0,
+        workers_alive: Optional[Callable[[], bool]] = None,
+    ):
+        """
+        Args:
+            queue_path: 共享队列 SQLite 文件
+            poll_interval: 轮询任务状态的间隔（秒）
+            workers_alive: 判断是否仍有 worker 存活的回调；返回 False 时未完成的页直接记为出错，
+                为 None 时一直等待（例如 worker 在其他机器上，可能稍后才加入）
+        """
+        super().__init__(max_workers=max_workers, dpi=dpi, cache_dir=cache_dir)
+        self.queue = TaskQueue(queue_path)
+        self.poll_interval = poll_interval
+        self.workers_alive = workers_alive
+        self._tasks: dict[str, list[int]] = {}
+        self._cached: dict[str, dict[int, list[InvoiceData]]] = {}
+        self._enqueue_errors: dict[str, Exception] = {}
+
+    def _enqueue(self, run_id: str, pdf_path: str) -> None:
+        # 大文件读取一次，哈希同时用于查询缓存和写入任务
+        file_hash = file_sha256(pdf_path)
+        if self.cache is not None:
+            keys, cached = self._load_cached_pages(pdf_path, file_hash)
+            pages = [page_num for page_num in keys if page_num not in cached]
+        else:
+            cached, pages = {}, list(range(1, pdf_page_count(pdf_path) + 1))
+        self._cached[pdf_path] = cached
+        self._tasks[pdf_path] = self.queue.enqueue(run_id, os.path.abspath(pdf_path), file_hash, self.dpi, pages)
+
+    def _extract_many(self, pdf_paths, progress_callback=None):
+        # 先把所有文件的任务写入队列，让 worker 立即满负荷工作，再按文件等待结果
+        run_id = uuid.uuid4().hex
+        self._tasks, self._cached, self._enqueue_errors = {}, {}, {}
+        for pdf_path in pdf_paths:
+            try:
+                self._enqueue(run_id, pdf_path)
+            except Exception as e:
+                # 在 _extract_one 中重新抛出，由 _extract_many 统一记录错误
+                self._enqueue_errors[pdf_path] = e
+        try:
+            return super()._extract_many(pdf_paths, progress_callback)
+        finally:
+            self.queue.purge_run(run_id)
+
+    def _extract_one(self, pdf_path: str) -> list[InvoiceData]:
+        if pdf_path in self._enqueue_errors:
+            raise self._enqueue_errors[pdf_path]
+        filename = Path(pdf_path).name
+        cached = self._cached[pdf_path]
+        task_ids = self._tasks[pdf_path]
+        total_pages = len(cached) + len(task_ids)
+        results: list[InvoiceData] = []
+        for page_num, page_results in cached.items():
+            results.extend(page_results)
+            invoice = page_results[0] if page_results else None
+            self._emit(PageEvent(filename, page_num, total_pages, "cached", invoice, invoices=page_results))
+        with self._stats_lock:
+            self.cache_hits += len(cached)
+
+        pending = set(task_ids)
+        while pending:
+            for task in self.queue.fetch(sorted(pending)):
+                if task["status"] == "done":
+                    page_results = [invoice_from_dict(data) for data in json.loads(task["result"])]
+                    results.extend(page_results)
+                    status = "done" if page_results else "skipped"
+                    invoice = page_results[0] if page_results else None
+                    self._emit(
+                        PageEvent(filename, task["page_number"], total_pages, status, invoice, invoices=page_results)
+                    )
+                elif task["status"] == "failed":
+                    print(f"  ✗ 处理第 {task['page_number']} 页时出错: {task['error']}")
+                    self.errors.setdefault(pdf_path, []).append(f"第 {task['page_number']} 页: {task['error']}")
+                    self._emit(PageEvent(filename, task["page_number"], total_pages, "error", error=task["error"]))
+                else:
+                    continue
+                pending.discard(task["id"])
+                with self._stats_lock:
+                    self.pages_processed += 1
+            if pending and self.workers_alive is not None and not self.workers_alive():
+                for task_id in sorted(pending):
+                    self.errors.setdefault(pdf_path, []).append(f"任务 {task_id}: 没有可用的 worker")
+                raise RuntimeError("所有 worker 均已退出，剩余页未处理")
+            if pending:
+                time.sleep(self.poll_interval)
+        return results
+
+
+def spawn_local_workers(
+    queue_path: str,
+    cache_dir: Optional[str],
+    api_keys: list[Optional[str]],
+    threads: int,
+    rpm: float,
+    extra_args: Optional[list[str]] = None,
+) -> list[subprocess.Popen]:
+    """在本机启动 worker 子进程，每个进程使用一个 API key（通过环境变量传递，不出现在命令行中）
+
+    Args:
+        extra_args: 追加到 worker 命令行的参数，如预算选项
+    """
+    processes = []
+    for api_key in api_keys:
+        env = dict(os.environ)
+        if api_key:
+            env["DEEPSEEK_API_KEY"] = api_key
+        cmd = [sys.executable, os.path.abspath(__file__), "worker", "--queue", queue_path]
+        cmd += ["--threads", str(threads), "--rpm", str(rpm), "--idle-exit", "30"]
+        if cache_dir:
+            cmd += ["--cache-dir", cache_dir]
+        cmd += extra_args or []
+        processes.append(subprocess.Popen(cmd, env=env))
+    return processes
+
+
+def add_budget_arguments(parser: argparse.ArgumentParser) -> None:
+    """worker 的当日预算选项；单次运行预算按 worker 进程计算，只能通过 BUDGET_RUN_* 环境变量配置"""
+    parser.add_argument("--budget-day-cost", type=float, default=BUDGET_DAY_COST, help="当日费用上限（元）")
+    parser.add_argument("--budget-day-tokens", type=int, default=BUDGET_DAY_TOKENS, help="当日 token 上限")
+    parser.add_argument("--pause-when-exhausted", action="store_true", help="当日预算用完时暂停到第二天而不是跳过")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="多进程/多机分布式发票解析")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    worker_parser = subparsers.add_parser("worker", help="启动 worker，从共享队列领取任务")
+    worker_parser.add_argument("--queue", required=True, help="共享队列 SQLite 文件")
+    worker_parser.add_argument("--cache-dir", help="共享结果缓存目录")
+    worker_parser.add_argument("--threads", type=int, default=4, help="worker 内并发请求数")
+    worker_parser.add_argument("--rpm", type=float, default=0, help="每分钟最多请求数，0 表示不限制")
+    worker_parser.add_argument("--model", default=DEEPSEEK_MODEL, help="模型名称")
+    worker_parser.add_argument("--idle-exit", type=float, help="空闲多少秒后自动退出，默认一直运行")
+    add_budget_arguments(worker_parser)
+
+    run_parser = subparsers.add_parser("run", help="作为协调者提交任务并汇总结果")
+    run_parser.add_argument("inputs", nargs="+", help="PDF文件、目录或 glob 模式")
+    run_parser.add_argument("-o", "--output", required=True, help="输出文件 (.xlsx/.csv/.json)")
+    run_parser.add_argument("--queue", required=True, help="共享队列 SQLite 文件")
+    run_parser.add_argument("--cache-dir", help="共享结果缓存目录")
+    run_parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="PDF 渲染 DPI")
+    run_parser.add_argument("--local-workers", type=int, default=0, help="在本机启动的 worker 进程数")
+    run_parser.add_argument("--threads", type=int, default=4, help="每个本机 worker 的并发请求数")
+    run_parser.add_argument("--rpm", type=float, default=0, help="每个本机 worker 每分钟最多请求数")
+    add_budget_arguments(run_parser)
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        worker = Worker(
+            TaskQueue(args.queue),
+            cache_dir=args.cache_dir,
+            api_key=os.getenv("DEEPSEEK_API_KEY"),
+            model=args.model,
+            requests_per_minute=args.rpm,
+            threads=args.threads,
+            idle_exit_seconds=args.idle_exit,
+            budget=BudgetTracker(
+                day_tokens=args.budget_day_tokens,
+                day_cost=args.budget_day_cost,
+                pause_when_exhausted=args.pause_when_exhausted,
+            ),
+        )
+        worker.run()
+        return 0
+
+    pdf_paths = collect_pdf_paths(args.inputs)
+    if not pdf_paths:
+        print("✗ 没有找到PDF文件", file=sys.stderr)
+        return EXIT_USAGE
+    output_format = Path(args.output).suffix.lstrip(".").lower()
+    if output_format not in OUTPUT_FORMATS:
+        print(f"✗ 不支持的输出格式: {args.output}", file=sys.stderr)
+        return EXIT_USAGE
+
+    # 没有配置多个 key 时，所有本机 worker 共用默认 key
+    api_keys: list[Optional[str]] = list(DEEPSEEK_API_KEYS) or [None]
+    worker_keys = [api_keys[i % len(api_keys)] for i in range(args.local_workers)]
+    budget_args = ["--budget-day-cost", str(args.budget_day_cost), "--budget-day-tokens", str(args.budget_day_tokens)]
+    if args.pause_when_exhausted:
+        budget_args.append("--pause-when-exhausted")
+    # worker 把用量记入共享的当日 ledger，协调者按运行前后的差值报告本次费用
+    budget = BudgetTracker()
+    day_before = budget.day_usage()
+    processes = spawn_local_workers(args.queue, args.cache_dir, worker_keys, args.threads, args.rpm, budget_args)
+    extractor = DistributedExtractor(
+        args.queue,
+        dpi=args.dpi,
+        cache_dir=args.cache_dir,
+        workers_alive=(lambda: any(p.poll() is None for p in processes)) if processes else None,
+    )
+    try:
+        invoices = extractor._extract_many(pdf_paths)
+        write_output(invoices, args.output, output_format)
+        print(f"✓ 结果已保存到: {args.output}")
+        day_after = budget.day_usage()
+        print(
+            f"  本次约 {day_after.requests - day_before.requests} 次请求, 费用约 {day_after.cost - day_before.cost:.4f} 元"
+            "（按当日用量 ledger 统计，包括同时使用该 ledger 的其他程序）"
+        )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return EXIT_PARTIAL_FAILURE if extractor.errors else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
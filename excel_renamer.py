@@ -1,10 +1,218 @@
 #!/usr/bin/env python3
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
 import threading
 import tkinter as tk
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
 from tkinter import filedialog, messagebox, scrolledtext, ttk
+from typing import Callable, Optional
+
+from order_index import DEFAULT_INDEX_PATH, OrderIndex, OrderLocation
+from result_cache import file_sha256
+from xlsx_zip import XlsxReader, rename_sheets, split_workbook, validate_sheet_name
+
+# 在每个 sheet 左上角 SEARCH_ROWS 行 × SEARCH_COLS 列内查找订单编号标签，编号在标签下方的单元格
+ORDER_LABEL = "订单编号"
+SEARCH_ROWS = 20
+SEARCH_COLS = 10
+
+
+def find_order_number(cells):
+    """在 XlsxReader.read_range 读出的单元格中查找订单编号，找不到时返回 None"""
+    for row in range(1, SEARCH_ROWS + 1):
+        for col in range(1, SEARCH_COLS + 1):
+            value = cells.get((row, col))
+            if value and ORDER_LABEL in str(value):
+                below = cells.get((row + 1, col))
+                if below and str(below).strip():
+                    return str(below).strip()
+                break
+    return None
+
+
+@dataclass
+class WorkbookResult:
+    """单个工作簿的处理结果"""
+
+    path: str
+    success: bool = False
+    renamed: int = 0
+    split_count: int = 0
+    error: str = ""
+    # 索引未变化而跳过处理
+    skipped: bool = False
+    sha256: str = ""
+    # [(sheet 序号, 原 sheet 名称, 新 sheet 名称, 订单编号), ...]
+    orders: list[tuple[int, str, str, str]] = field(default_factory=list)
+    renamed_path: str = ""
+    split_dir: str = ""
+    # 处理过程中的日志，多进程处理时随结果一起返回，保证同一文件的日志不被打散
+    logs: list[str] = field(default_factory=list)
+
+
+def process_workbook(path: str, split_workers: Optional[int] = None) -> WorkbookResult:
+    """按订单编号重命名工作簿中的 sheet，保存为 *_renamed.xlsx，并把每个 sheet 拆分到同名目录中
+
+    Args:
+        path: 工作簿路径
+        split_workers: 拆分时并行写出的线程数
+
+    Returns:
+        处理结果，出错时 success 为 False 并记录错误信息
+    """
+    result = WorkbookResult(path=path)
+    log = result.logs.append
+    try:
+        log(f"\n{'─' * 60}")
+        log(f"处理: {Path(path).name}")
+        # 记录处理时的内容哈希，供索引判断文件之后是否改变
+        result.sha256 = file_sha256(path)
+
+        # 只流式读取每个 sheet 左上角的单元格，不加载整个工作簿
+        to_rename = []
+        with XlsxReader(path) as reader:
+            sheet_names = [sheet.name for sheet in reader.sheets]
+            for sheet in reader.sheets:
+                log(f"  检查: {sheet.name}")
+                order_num = find_order_number(reader.read_range(sheet, SEARCH_ROWS + 1, SEARCH_COLS))
+                if order_num:
+                    log(f"    → 找到: {order_num}")
+                    to_rename.append((sheet.index, sheet.name, order_num))
+                else:
+                    log("    未找到订单编号")
 
-import openpyxl
+        renames = {}
+        for _, old, new in to_rename:
+            try:
+                # Excel 中 sheet 名称不区分大小写
+                if any(name.lower() == new.lower() and name != old for name in sheet_names):
+                    log(f"    跳过: {new} 已存在")
+                    continue
+                validate_sheet_name(new)
+                sheet_names[sheet_names.index(old)] = new
+                renames[old] = new
+                log(f"    ✓ {old} → {new}")
+                result.renamed += 1
+            except Exception as e:
+                log(f"    ✗ 失败: {e}")
+
+        # 只改写 workbook.xml 中的 sheet 名称，其余内容原样复制
+        out = path.replace('.xlsx', '_renamed.xlsx')
+        rename_sheets(path, out, renames)
+        result.renamed_path = out
+        result.orders = [(index, old, renames.get(old, old), order_num) for index, old, order_num in to_rename]
+        log(f"✓ 保存: {Path(out).name} (重命名 {result.renamed} 个)")
+
+        # 拆分 sheet 为单个文件
+        log("\n开始拆分 sheet...")
+        result.split_count = split_sheets(out, path, log, split_workers)
+        result.split_dir = str(Path(path).parent / Path(path).stem)
+        log(f"✓ 拆分完成: 生成 {result.split_count} 个文件")
+
+        result.success = True
+    except Exception as e:
+        result.error = str(e)
+        log(f"✗ 错误: {e}")
+    return result
+
+
+def split_sheets(
+    renamed_path: str, original_path: str, log: Callable[[str], None] = print, max_workers: Optional[int] = None
+) -> int:
+    """将每个 sheet 拆分成单个 excel 文件（只读取一次工作簿，在 zip 层面复制各 sheet）"""
+    # 创建输出目录
+    path_obj = Path(original_path)
+    base_name = path_obj.stem  # 不包含扩展名的文件名
+    output_dir = path_obj.parent / base_name
+
+    # 如果目录不存在则创建
+    if not output_dir.exists():
+        output_dir.mkdir(parents=True)
+        log(f"  创建目录: {output_dir.name}")
+
+    results = split_workbook(renamed_path, str(output_dir), max_workers)
+    for _, output_path in results:
+        log(f"  ✓ 生成: {output_path.name}")
+
+    return len(results)
+
+
+def process_workbooks(
+    paths: list[str],
+    max_workers: Optional[int] = None,
+    callback: Optional[Callable[[WorkbookResult, int, int], None]] = None,
+    index: Optional[OrderIndex] = None,
+    force: bool = False,
+) -> list[WorkbookResult]:
+    """用进程池并行处理多个工作簿，每个进程处理一个文件
+
+    Args:
+        paths: 工作簿路径列表
+        max_workers: 进程数，默认为 CPU 核数；为 1 时在当前进程中依次处理
+        callback: 每完成一个文件在调用线程中回调，参数为 (结果, 已完成数量, 总数量)
+        index: 订单编号索引，处理成功的文件会写入索引；自上次处理后未改变的文件直接跳过
+        force: 为 True 时即使文件未改变也重新处理
+
+    Returns:
+        按完成顺序排列的处理结果
+    """
+    total = len(paths)
+    results = []
+
+    def finish(result: WorkbookResult) -> None:
+        # 索引只在当前进程中写入，避免多个进程同时写 SQLite
+        if index is not None and result.success and not result.skipped:
+            index.update_workbook(
+                result.path, result.sha256, result.orders, result.renamed_path, result.split_dir
+            )
+        results.append(result)
+        if callback:
+            callback(result, len(results), total)
+
+    pending = []
+    for path in paths:
+        renamed_path = path.replace('.xlsx', '_renamed.xlsx')
+        if index is not None and not force and os.path.exists(renamed_path) and index.is_unchanged(path):
+            finish(WorkbookResult(path=path, success=True, skipped=True, logs=[f"跳过未变化的文件: {Path(path).name}"]))
+        else:
+            pending.append(path)
+
+    workers = min(max_workers or os.cpu_count() or 1, max(len(pending), 1))
+    if workers == 1:
+        for path in pending:
+            finish(process_workbook(path))
+        return results
+
+    # 多进程时每个进程内只用一个线程拆分，避免线程数超过 CPU 核数
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_workbook, path, 1): path for path in pending}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # 子进程异常退出等无法在 process_workbook 内捕获的错误
+                result = WorkbookResult(path=futures[future], error=str(e), logs=[f"✗ 错误: {e}"])
+            finish(result)
+    return results
+
+
+def collect_workbook_paths(inputs: list[str]) -> list[str]:
+    """展开命令行输入：文件直接使用，目录取其中的 .xlsx 文件（不递归，跳过已生成的 *_renamed.xlsx）"""
+    paths: dict[str, None] = {}
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            for child in sorted(path.glob("*.xlsx")):
+                if not child.name.endswith("_renamed.xlsx") and not child.name.startswith("~$"):
+                    paths.setdefault(str(child), None)
+        else:
+            paths.setdefault(item, None)
+    return list(paths)
 
 
 class ExcelSheetRenamerApp:
@@ -25,6 +233,11 @@ class ExcelSheetRenamerApp:
 
         self.root.configure(bg=self.bg_main)
         self.selected_files = []
+        # 后台线程发给界面的消息队列，由 poll_queue 在主线程中处理
+        self.queue = queue.Queue()
+        self.success_count = 0
+        # 订单编号索引：记录已处理的文件，再次处理时跳过未改变的文件，并支持按订单编号查找
+        self.index = OrderIndex()
         self.setup_ui()
 
     def setup_ui(self):
@@ -170,6 +383,31 @@ class ExcelSheetRenamerApp:
         )
         self.progress.pack(fill=tk.X, pady=(0, 15))
 
+        # Order search
+        search_frame = tk.Frame(main, bg=self.bg_main)
+        search_frame.pack(fill=tk.X, pady=(0, 15))
+
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(search_frame, textvariable=self.search_var, font=("Helvetica", 12))
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        search_entry.bind("<Return>", lambda event: self.find_order())
+
+        tk.Button(
+            search_frame,
+            text="查找订单",
+            command=self.find_order,
+            font=("Helvetica", 12, "bold"),
+            bg=self.primary,
+            fg="white",
+            activebackground=self.primary_hover,
+            activeforeground="white",
+            relief=tk.RAISED,
+            bd=2,
+            padx=20,
+            cursor="hand2",
+            width=8
+        ).pack(side=tk.RIGHT)
+
         # Log section
         log_frame = tk.Frame(main, bg=self.bg_card, relief=tk.RAISED, bd=1)
         log_frame.pack(fill=tk.BOTH, expand=True)
@@ -203,7 +441,6 @@ class ExcelSheetRenamerApp:
         self.log_text.insert(tk.END, msg + "\n")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
-        self.root.update_idletasks()
 
     def update_count(self):
         self.count_label.config(text=f"{len(self.selected_files)} 个文件")
@@ -235,131 +472,63 @@ class ExcelSheetRenamerApp:
             self.update_count()
             self.log("清空文件列表")
 
-    def process_single(self, path):
+    def process_thread(self):
+        """后台线程：驱动进程池，把结果放入队列，由主线程中的 poll_queue 更新界面"""
         try:
-            self.log(f"\n{'─' * 60}")
-            self.log(f"处理: {Path(path).name}")
-
-            wb = openpyxl.load_workbook(path)
-            to_rename = []
-
-            for sheet in wb.worksheets:
-                self.log(f"  检查: {sheet.title}")
-                order_num = None
-
-                for row in sheet.iter_rows(min_row=1, max_row=20, min_col=1, max_col=10):
-                    for cell in row:
-                        if cell.value and "订单编号" in str(cell.value) and cell.row and cell.column:
-                            below = sheet.cell(row=cell.row + 1, column=cell.column)
-                            if below.value:
-                                order_num = str(below.value).strip()
-                                self.log(f"    → 找到: {order_num}")
-                            break
-                    if order_num:
-                        break
-
-                if order_num:
-                    to_rename.append((sheet.title, order_num))
-                else:
-                    self.log("    未找到订单编号")
-
-            renamed = 0
-            for old, new in to_rename:
-                try:
-                    sheet = wb[old]
-                    if new in wb.sheetnames and new != old:
-                        self.log(f"    跳过: {new} 已存在")
-                        continue
-                    sheet.title = new
-                    self.log(f"    ✓ {old} → {new}")
-                    renamed += 1
-                except Exception as e:
-                    self.log(f"    ✗ 失败: {e}")
-
-            out = path.replace('.xlsx', '_renamed.xlsx')
-            wb.save(out)
-            self.log(f"✓ 保存: {Path(out).name} (重命名 {renamed} 个)")
-
-            # 拆分 sheet 为单个文件
-            self.log("\n开始拆分 sheet...")
-            split_count = self.split_sheets(wb, path)
-            self.log(f"✓ 拆分完成: 生成 {split_count} 个文件")
-
-            return True
-
+            process_workbooks(
+                list(self.selected_files),
+                callback=lambda result, completed, total: self.queue.put(("result", result, completed, total)),
+                index=self.index,
+            )
         except Exception as e:
-            self.log(f"✗ 错误: {e}")
-            return False
-
-    def split_sheets(self, wb, original_path):
-        """将每个 sheet 拆分成单个 excel 文件"""
-        # 创建输出目录
-        path_obj = Path(original_path)
-        base_name = path_obj.stem  # 不包含扩展名的文件名
-        output_dir = path_obj.parent / base_name
+            self.queue.put(("error", str(e)))
+        self.queue.put(("done",))
 
-        # 如果目录不存在则创建
-        if not output_dir.exists():
-            output_dir.mkdir(parents=True)
-            self.log(f"  创建目录: {output_dir.name}")
-
-        split_count = 0
-
-        # 获取所有 sheet 名称
-        sheet_names = [sheet.title for sheet in wb.worksheets]
-
-        # 对每个 sheet 创建单独的文件
-        for sheet_name in sheet_names:
-            try:
-                # 重新加载原始文件（保留所有原始格式）
-                new_wb = openpyxl.load_workbook(
-                    original_path.replace('.xlsx', '_renamed.xlsx')
-                )
-
-                # 删除除当前 sheet 外的所有 sheet
-                sheets_to_remove = [s for s in new_wb.sheetnames if s != sheet_name]
-                for s in sheets_to_remove:
-                    new_wb.remove(new_wb[s])
-
-                # 使用 sheet 名称作为文件名
-                file_name = f"{sheet_name}.xlsx"
-                output_path = output_dir / file_name
-
-                # 保存文件
-                new_wb.save(output_path)
-                self.log(f"  ✓ 生成: {file_name}")
-                split_count += 1
-
-            except Exception as e:
-                self.log(f"  ✗ 拆分 {sheet_name} 失败: {e}")
+    def poll_queue(self):
+        """在 Tk 主线程中处理后台队列中的消息（Tk 组件只能在主线程中操作）"""
+        finished = False
+        try:
+            while True:
+                message = self.queue.get_nowait()
+                if message[0] == "result":
+                    _, result, completed, total = message
+                    for line in result.logs:
+                        self.log(line)
+                    if result.success:
+                        self.success_count += 1
+                    self.progress_var.set((completed / total) * 100)
+                elif message[0] == "error":
+                    self.log(f"✗ 错误: {message[1]}")
+                else:
+                    finished = True
+        except queue.Empty:
+            pass
 
-        return split_count
+        if not finished:
+            self.root.after(50, self.poll_queue)
+            return
 
-    def process_thread(self):
         total = len(self.selected_files)
-        success = 0
-
-        self.log(f"\n{'═' * 60}")
-        self.log(f"开始处理 {total} 个文件")
-        self.log(f"{'═' * 60}")
-
-        for idx, path in enumerate(self.selected_files, 1):
-            if self.process_single(path):
-                success += 1
-
-            self.progress_var.set((idx / total) * 100)
-            self.root.update_idletasks()
-
         self.log(f"\n{'═' * 60}")
-        self.log(f"完成! 成功: {success}/{total}")
+        self.log(f"完成! 成功: {self.success_count}/{total}")
         self.log(f"{'═' * 60}")
 
-        messagebox.showinfo("完成", f"处理完成!\n\n成功: {success}/{total}")
+        messagebox.showinfo("完成", f"处理完成!\n\n成功: {self.success_count}/{total}")
 
         self.select_btn.config(state=tk.NORMAL)
         self.process_btn.config(state=tk.NORMAL)
         self.clear_btn.config(state=tk.NORMAL)
 
+    def find_order(self):
+        query = self.search_var.get().strip()
+        if not query:
+            return
+        locations = self.index.find(query) or self.index.search(query)
+        if not locations:
+            self.log(f"✗ 未找到订单: {query}")
+        for location in locations:
+            self.log(format_location(location))
+
     def process_files(self):
         if not self.selected_files:
             messagebox.showwarning("提示", "请先选择文件")
@@ -369,11 +538,87 @@ class ExcelSheetRenamerApp:
         self.process_btn.config(state=tk.DISABLED)
         self.clear_btn.config(state=tk.DISABLED)
         self.progress_var.set(0)
+        self.success_count = 0
+
+        self.log(f"\n{'═' * 60}")
+        self.log(f"开始处理 {len(self.selected_files)} 个文件")
+        self.log(f"{'═' * 60}")
 
         threading.Thread(target=self.process_thread, daemon=True).start()
+        self.root.after(50, self.poll_queue)
+
+
+def run_headless(argv: Optional[list[str]] = None) -> int:
+    """命令行批量处理，所有文件成功时返回 0，否则返回 1"""
+    parser = argparse.ArgumentParser(prog="excel_renamer.py", description="按订单编号重命名并拆分 Excel sheet")
+    parser.add_argument("inputs", nargs="*", help="Excel 文件或目录（处理目录中的 .xlsx 文件，不递归）")
+    parser.add_argument("-j", "--workers", type=int, help="并行处理的进程数，默认为 CPU 核数")
+    parser.add_argument("-q", "--quiet", action="store_true", help="只输出每个文件的结果，不输出逐个 sheet 的日志")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="订单编号索引路径")
+    parser.add_argument("--no-index", action="store_true", help="不使用索引，每次都处理全部文件")
+    parser.add_argument("--force", action="store_true", help="重新处理未改变的文件")
+    parser.add_argument("--find", action="append", metavar="ORDER", help="在索引中查找订单编号（可部分匹配），可重复")
+    parser.add_argument("--prune", action="store_true", help="从索引中删除已不存在的工作簿")
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.find and not args.prune:
+        parser.error("需要指定要处理的文件、--find 或 --prune")
+    if args.no_index and (args.find or args.prune):
+        parser.error("--find/--prune 不能与 --no-index 同时使用")
+
+    index = None if args.no_index else OrderIndex(args.index)
+    if args.prune:
+        print(f"✓ 已从索引中删除 {index.remove_missing()} 个不存在的工作簿")  # type: ignore[union-attr]
+    if args.find:
+        return find_orders(index, args.find)  # type: ignore[arg-type]
+    if not args.inputs:
+        return 0
+
+    paths = collect_workbook_paths(args.inputs)
+    if not paths:
+        print("✗ 没有找到 Excel 文件", file=sys.stderr)
+        return 2
+
+    def report(result: WorkbookResult, completed: int, total: int) -> None:
+        if not args.quiet:
+            print("\n".join(result.logs))
+        status = "✓" if result.success else f"✗ {result.error}"
+        print(f"[{completed}/{total}] {Path(result.path).name}: {status}", flush=True)
+
+    results = process_workbooks(paths, args.workers, report, index, args.force)
+    failed = [result for result in results if not result.success]
+    skipped = sum(1 for result in results if result.skipped)
+    print(f"完成! 成功: {len(results) - len(failed)}/{len(results)}" + (f"（未变化跳过 {skipped} 个）" if skipped else ""))
+    return 1 if failed else 0
+
+
+def format_location(location: OrderLocation) -> str:
+    """订单编号位置的一行描述"""
+    text = f"{location.order_number}: {location.path} [{location.original_sheet}]"
+    if location.sheet_name != location.original_sheet:
+        text += f" → {location.renamed_path} [{location.sheet_name}]"
+    if location.split_file:
+        text += f"\n    拆分文件: {location.split_file}"
+    return text
+
+
+def find_orders(index: OrderIndex, queries: list[str]) -> int:
+    """在索引中查找订单编号：先精确匹配，没有结果时按包含匹配；全部找到时返回 0"""
+    not_found = 0
+    for query in queries:
+        locations = index.find(query) or index.search(query)
+        if not locations:
+            print(f"✗ 未找到: {query}")
+            not_found += 1
+        for location in locations:
+            print(format_location(location))
+    return 1 if not_found else 0
 
 
 def main():
+    # 打包后的可执行文件中使用进程池需要 freeze_support
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        sys.exit(run_headless())
     root = tk.Tk()
     app = ExcelSheetRenamerApp(root)
     root.mainloop()
@@ -0,0 +1,350 @@
+"""Local HTTP extraction service with warm clients and a job queue
+
+接口:
+    POST /jobs                  上传PDF创建任务（multipart/form-data 多文件，或 application/pdf + ?filename=xx.pdf）
+    GET  /jobs                  任务列表
+    GET  /jobs/<id>             任务状态
+    GET  /jobs/<id>/events      以 NDJSON 流式返回单页事件，任务结束后关闭连接
+    GET  /jobs/<id>/result      任务结果，?format=json（默认）| xlsx | csv
+    GET  /health                健康检查
+"""
+
+import argparse
+import json
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from email import message_from_bytes
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from config import DEFAULT_DPI, MAX_WORKERS
+from financial import InvoiceData, InvoiceExtractor, PageEvent, write_output
+
+# 保留的已结束任务数，超出后丢弃最早的任务
+MAX_FINISHED_JOBS = 200
+
+RESULT_CONTENT_TYPES = {
+    "json": "application/json; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+@dataclass
+class Job:
+    """一个解析任务"""
+
+    id: str
+    workdir: Path
+    filenames: list[str]
+    status: str = "queued"  # queued | running | finished | failed
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    events: list[dict] = field(default_factory=list)
+    invoices: list[InvoiceData] = field(default_factory=list)
+    errors: dict[str, list[str]] = field(default_factory=dict)
+    files_done: int = 0
+    condition: threading.Condition = field(default_factory=threading.Condition)
+
+    def add_event(self, event: dict) -> None:
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self) -> None:
+        """添加最终状态事件并标记任务结束
+
+        两者在同一次加锁中完成：事件流看到 finished_at 时，最终状态事件一定已经在 events 中。
+        """
+        with self.condition:
+            self.events.append({"type": "status", "status": self.status})
+            self.finished_at = time.time()
+            self.condition.notify_all()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "files": self.filenames,
+            "files_done": self.files_done,
+            "pages_done": sum(1 for event in self.events if event["type"] == "page"),
+            "invoices": len(self.invoices),
+            "errors": self.errors,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ExtractionService:
+    """持有一个常驻的 InvoiceExtractor，按提交顺序依次执行任务
+
+    所有任务共享同一组 API 客户端、线程池和结果缓存，因此也共享同一份速率限制额度。
+    """
+
+    def __init__(self, extractor: InvoiceExtractor, workdir: Optional[str] = None):
+        self.extractor = extractor
+        self.extractor.page_callback = self._on_page
+        self.workdir = Path(workdir or tempfile.mkdtemp(prefix="invoice-service-"))
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._queue: queue.Queue[Optional[Job]] = queue.Queue()
+        self._current: Optional[Job] = None
+        self._runner = threading.Thread(target=self._run, name="invoice-service-runner", daemon=True)
+        self._runner.start()
+
+    def submit(self, files: list[tuple[str, bytes]]) -> Job:
+        """保存上传的文件并加入任务队列
+
+        Raises:
+            ValueError: 文件名为空、为 . 或 ..，或包含非法字符
+        """
+        filenames = _upload_filenames([name for name, _ in files])
+        job_id = uuid.uuid4().hex
+        job_dir = self.workdir / job_id
+        job_dir.mkdir()
+        for filename, (_, content) in zip(filenames, files):
+            (job_dir / filename).write_bytes(content)
+        job = Job(id=job_id, workdir=job_dir, filenames=filenames)
+        with self._jobs_lock:
+            self.jobs[job_id] = job
+            self._trim_jobs()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._runner.join()
+        self.extractor.close()
+
+    def _trim_jobs(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _on_page(self, event: PageEvent) -> None:
+        job = self._current
+        if job is None:
+            return
+        job.add_event(
+            {
+                "type": "page",
+                "filename": event.filename,
+                "page_number": event.page_number,
+                "total_pages": event.total_pages,
+                "status": event.status,
+                "invoice": asdict(event.invoice) if event.invoice else None,
+                "invoices": [asdict(invoice) for invoice in event.invoices],
+                "error": event.error,
+            }
+        )
+
+    def _on_file(self, job: Job, filename: str, completed: int, total: int) -> None:
+        job.files_done = completed
+        job.add_event({"type": "file", "filename": filename, "completed": completed, "total": total})
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._current = job
+            job.status = "running"
+            job.add_event({"type": "status", "status": job.status})
+            try:
+                pdf_paths = [str(job.workdir / name) for name in job.filenames]
+                job.invoices = self.extractor._extract_many(
+                    pdf_paths, lambda name, done, total: self._on_file(job, name, done, total)
+                )
+                job.errors = {Path(path).name: messages for path, messages in self.extractor.errors.items()}
+                job.status = "finished"
+            except Exception as e:
+                job.errors = {"": [str(e)]}
+                job.status = "failed"
+            finally:
+                self._current = None
+                shutil.rmtree(job.workdir, ignore_errors=True)
+                job.finish()
+
+
+def _upload_filenames(names: list[str]) -> list[str]:
+    """把上传的文件名转换为任务目录内的文件名：只保留文件名部分防止路径穿越，重名时追加 (2)、(3) 等后缀"""
+    filenames: list[str] = []
+    used: set[str] = set()
+    for name in names:
+        # 兼容浏览器上传的 Windows 完整路径（C:\Users\...\a.pdf）
+        filename = name.replace("\\", "/").rsplit("/", 1)[-1].strip()
+        if filename in ("", ".", "..") or "\0" in filename:
+            raise ValueError(f"无效的文件名: {name!r}")
+        stem, suffix = Path(filename).stem, Path(filename).suffix
+        counter = 1
+        # 按小写比较，Windows/macOS 的文件系统不区分大小写
+        while filename.lower() in used:
+            counter += 1
+            filename = f"{stem} ({counter}){suffix}"
+        used.add(filename.lower())
+        filenames.append(filename)
+    return filenames
+
+
+def _parse_upload(content_type: str, body: bytes, query: dict[str, list[str]]) -> list[tuple[str, bytes]]:
+    """解析上传内容，返回 [(文件名, 内容), ...]"""
+    if content_type.startswith("multipart/form-data"):
+        message = message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + body, policy=HTTP)
+        files = []
+        for part in message.iter_parts():
+            filename = part.get_filename()
+            if filename:
+                files.append((filename, part.get_payload(decode=True) or b""))
+        return files
+    filename = query.get("filename", ["upload.pdf"])[0]
+    return [(filename, body)] if body else []
+
+
+def make_handler(service: ExtractionService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # noqa: A002
+            print(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}", file=sys.stderr)
+
+        def _send_json(self, data, status: HTTPStatus = HTTPStatus.OK) -> None:
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status: HTTPStatus, message: str) -> None:
+            self._send_json({"error": message}, status)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["health"]:
+                self._send_json({"status": "ok"})
+            elif parts == ["jobs"]:
+                with service._jobs_lock:
+                    jobs = [job.to_dict() for job in service.jobs.values()]
+                self._send_json(jobs)
+            elif len(parts) >= 2 and parts[0] == "jobs":
+                job = service.get(parts[1])
+                if job is None:
+                    self._send_error(HTTPStatus.NOT_FOUND, "任务不存在")
+                elif len(parts) == 2:
+                    self._send_json(job.to_dict())
+                elif parts[2:] == ["events"]:
+                    self._stream_events(job)
+                elif parts[2:] == ["result"]:
+                    self._send_result(job, parse_qs(url.query).get("format", ["json"])[0])
+                else:
+                    self._send_error(HTTPStatus.NOT_FOUND, "接口不存在")
+            else:
+                self._send_error(HTTPStatus.NOT_FOUND, "接口不存在")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/jobs":
+                self._send_error(HTTPStatus.NOT_FOUND, "接口不存在")
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            files = _parse_upload(self.headers.get("Content-Type", ""), body, parse_qs(url.query))
+            if not files:
+                self._send_error(HTTPStatus.BAD_REQUEST, "没有上传PDF文件")
+                return
+            try:
+                job = service.submit(files)
+            except ValueError as e:
+                self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+                return
+            self._send_json(job.to_dict(), HTTPStatus.ACCEPTED)
+
+        def _stream_events(self, job: Job) -> None:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            sent = 0
+            while True:
+                with job.condition:
+                    job.condition.wait_for(lambda: len(job.events) > sent or job.finished_at is not None, timeout=15)
+                    pending = job.events[sent:]
+                    finished = job.finished_at is not None
+                sent += len(pending)
+                # 没有新事件时发送空行作为心跳，保持连接
+                lines = [json.dumps(event, ensure_ascii=False) for event in pending] or [""]
+                chunk = ("\n".join(lines) + "\n").encode("utf-8")
+                try:
+                    self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                if finished and sent == len(job.events):
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _send_result(self, job: Job, output_format: str) -> None:
+            if output_format not in RESULT_CONTENT_TYPES:
+                self._send_error(HTTPStatus.BAD_REQUEST, f"不支持的格式: {output_format}")
+                return
+            if job.finished_at is None:
+                self._send_error(HTTPStatus.CONFLICT, "任务尚未完成")
+                return
+            with tempfile.TemporaryDirectory() as tmp:
+                output_path = Path(tmp) / f"result.{output_format}"
+                write_output(job.invoices, str(output_path), output_format)
+                body = output_path.read_bytes()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", RESULT_CONTENT_TYPES[output_format])
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Content-Disposition", f'attachment; filename="{job.id}.{output_format}"')
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="本地发票解析 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，局域网共享时使用 0.0.0.0")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("-j", "--workers", type=int, default=MAX_WORKERS, help="同时处理的文件数")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="PDF 渲染 DPI")
+    parser.add_argument("--cache-dir", help="单页结果缓存目录")
+    parser.add_argument("--workdir", help="上传文件的临时目录")
+    args = parser.parse_args(argv)
+
+    extractor = InvoiceExtractor(max_workers=args.workers, dpi=args.dpi, cache_dir=args.cache_dir)
+    service = ExtractionService(extractor, args.workdir)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    server.daemon_threads = True
+    print(f"发票解析服务已启动: http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,52 @@
+"""Invoice PDF extractor
+
+pandas、openai、pdf2image、PIL 等较重的依赖只在实际用到时才导入，
+以便 GUI 和命令行可以快速启动；需要提前加载时调用 warm_up()。
+"""
+
+from __future__ import annotations
+
+import argparse
 import base64
+import contextlib
+import glob
 import json
+import os
+import sys
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
 from io import BytesIO
-from typing import Callable, Optional
-
-import pandas as pd
-from openai import OpenAI
-from pdf2image import convert_from_path
-from PIL import Image
-
-from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, MAX_WORKERS
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
+
+from config import (
+    BUDGET_DAY_COST,
+    BUDGET_DAY_TOKENS,
+    BUDGET_RUN_COST,
+    BUDGET_RUN_TOKENS,
+    DEEPSEEK_API_KEY,
+    DEEPSEEK_BASE_URL,
+    DEEPSEEK_ECONOMY_MODEL,
+    DEEPSEEK_MODEL,
+    DEFAULT_DPI,
+    DEFAULT_OUTPUT_FILENAME,
+    ECONOMY_DPI,
+    MAX_WORKERS,
+    PAGE_WORKERS,
+    REGION_DETECTION,
+)
+from budget import BUDGET_ECONOMY, BudgetTracker
+from profiling import Profiler, span
+from result_cache import ResultCache, file_sha256
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from PIL import Image
+
+    from invoice_store import InvoiceStore
 
 
 @dataclass
@@ -40,26 +76,127 @@ class InvoiceData:
     issuer: str
     is_invoice: bool = True
     filename: str = ""
+    # 来源PDF的绝对路径，用于区分不同目录下的同名文件
+    source_path: str = ""
     page_number: int = 1
+    # 同一页上的第几张发票（按从上到下、从左到右的顺序），整页只有一张时为 1
+    region: int = 1
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class ExtractionCancelled(Exception):
+    """处理已被取消"""
+
+
+@dataclass
+class PageEvent:
+    """单页处理事件
+
+    status 取值: done（识别到发票）, skipped（不是发票）, cached（命中缓存）, error（出错）
+    一页上有多张发票时 invoice 为第一张，invoices 为全部。
+    """
+
+    filename: str
+    page_number: int
+    total_pages: int
+    status: str
+    invoice: Optional[InvoiceData] = None
+    error: str = ""
+    invoices: list[InvoiceData] = field(default_factory=list)
 
 
 def image_to_base64(image: Image.Image) -> str:
     """将 PIL Image 转换为 base64 字符串"""
-    buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    with span("encode", width=image.width, height=image.height):
+        buffered = BytesIO()
+        image.save(buffered, format="PNG")
+        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+
+def is_blank_page(image: Image.Image, ink_ratio: float = 0.005) -> bool:
+    """粗略判断页面是否基本空白（深色像素占比低于 ink_ratio），用于省钱模式下跳过扫描背面、隔页纸等"""
+    thumbnail = image.convert("L")
+    thumbnail.thumbnail((256, 256))
+    histogram = thumbnail.histogram()
+    return sum(histogram[:200]) / max(1, sum(histogram)) < ink_ratio
+
+
+def scale_to_dpi(image: Image.Image, from_dpi: int, to_dpi: int) -> Image.Image:
+    """将按 from_dpi 渲染的图片缩放到 to_dpi 对应的尺寸"""
+    if to_dpi >= from_dpi:
+        return image
+    from PIL import Image
+
+    ratio = to_dpi / from_dpi
+    return image.resize((max(1, round(image.width * ratio)), max(1, round(image.height * ratio))), Image.LANCZOS)
+
+
+# 按区域裁剪时的缓存版本标记，区域检测算法改变时需要更新，避免复用旧的结果
+REGION_LAYOUT = "regions-v1"
+
+
+def page_regions(image: Image.Image, detect_regions: bool = True) -> list[Image.Image]:
+    """返回需要分别识别的图片：检测到多个发票区域时为各区域的裁剪，否则为（去掉空白边距的）整页"""
+    if not detect_regions:
+        return [image]
+    from layout import crop_invoice_regions
+
+    with span("layout", width=image.width, height=image.height):
+        return crop_invoice_regions(image)
+
 
+def pdf_to_images(
+    pdf_path: str, dpi: int = DEFAULT_DPI, first_page: Optional[int] = None, last_page: Optional[int] = None
+) -> list[Image.Image]:
+    """将 PDF 转换为图片列表，每页一张图片，可只转换 [first_page, last_page] 范围内的页"""
+    from pdf2image import convert_from_path
 
-def pdf_to_images(pdf_path: str) -> list[Image.Image]:
-    """将 PDF 转换为图片列表，每页一张图片"""
-    images = convert_from_path(pdf_path, dpi=200)
+    with span("rasterize", file=Path(pdf_path).name, first_page=first_page, last_page=last_page):
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
     return images
 
 
-def parse_invoice_from_image(image_base64: str) -> InvoiceData:
-    """使用 DeepSeek API 从图片中解析发票信息"""
-    # 初始化 OpenAI 客户端，指向 DeepSeek API
-    client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+def pdf_page_count(pdf_path: str) -> int:
+    """读取 PDF 页数，不进行渲染"""
+    from pdf2image import pdfinfo_from_path
+
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+@lru_cache(maxsize=None)
+def get_client(api_key: Optional[str] = DEEPSEEK_API_KEY, base_url: Optional[str] = DEEPSEEK_BASE_URL) -> OpenAI:
+    """获取 OpenAI 客户端（指向 DeepSeek API），相同配置复用同一个客户端和连接池"""
+    from openai import OpenAI
+
+    return OpenAI(api_key=api_key, base_url=base_url)
+
+
+def warm_up() -> None:
+    """提前导入解析所需的重量级依赖，可在后台线程中调用以缩短首次解析的等待时间"""
+    import openai  # noqa: F401
+    import pandas  # noqa: F401
+    import pdf2image  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+
+def invoice_from_dict(data: dict) -> InvoiceData:
+    """从 asdict() 的结果还原 InvoiceData"""
+    items = [InvoiceItem(**item) for item in data.get("items", [])]
+    return InvoiceData(**{**data, "items": items})
+
+
+def parse_invoice_from_image(
+    image_base64: str, client: Optional[OpenAI] = None, model: Optional[str] = None
+) -> InvoiceData:
+    """使用 DeepSeek API 从图片中解析发票信息
+
+    Args:
+        image_base64: PNG 图片的 base64 编码
+        client: OpenAI 客户端，默认使用 config 中的配置
+        model: 模型名称，默认使用 config 中的 DEEPSEEK_MODEL
+    """
+    client = client or get_client()
 
     # 构建 prompt
     prompt = """请分析这张图片，首先判断它是否是发票。如果是发票，提取所有相关信息；如果不是发票，只需要返回 is_invoice 为 false。
@@ -94,30 +231,32 @@ def parse_invoice_from_image(image_base64: str) -> InvoiceData:
 注意：如果 is_invoice 为 false，其他字段可以填空字符串或0。"""
 
     # 调用 DeepSeek API with vision
-    response = client.chat.completions.create(
-        model=DEEPSEEK_MODEL,
-        messages=[
-            {
-                "role": "system",
-                "content": "你是一个专业的发票信息提取助手，擅长从图片中识别并提取发票的各项信息。",
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}},
-                ],
-            },
-        ],
-        temperature=0.1,
-        response_format={"type": "json_object"},
-    )
+    with span("request", payload_bytes=len(image_base64)):
+        response = client.chat.completions.create(
+            model=model or DEEPSEEK_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "你是一个专业的发票信息提取助手，擅长从图片中识别并提取发票的各项信息。",
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image_base64}"}},
+                    ],
+                },
+            ],
+            temperature=0.1,
+            response_format={"type": "json_object"},
+        )
 
     # 解析响应
     content = response.choices[0].message.content
     if not content:
         raise ValueError("DeepSeek API 返回的内容为空")
-    result = json.loads(content)
+    with span("parse"):
+        result = json.loads(content)
 
     # 转换为 InvoiceData 对象
     items = [InvoiceItem(**item) for item in result.get("items", [])]
@@ -137,108 +276,417 @@ def parse_invoice_from_image(image_base64: str) -> InvoiceData:
         issuer=result.get("issuer", ""),
     )
 
+    # 记录本次请求的 token 用量，用于预算统计
+    if response.usage is not None:
+        invoice_data.prompt_tokens = response.usage.prompt_tokens or 0
+        invoice_data.completion_tokens = response.usage.completion_tokens or 0
+
     return invoice_data
 
 
-class InvoiceExtractor:
-    """PDF invoice data extractor"""
+def invoices_to_rows(invoices: list[InvoiceData]) -> list[dict]:
+    """将发票数据展开为表格行，每个item独立成一行"""
+    rows = []
+    for invoice in invoices:
+        # 基础发票信息（不包含items）
+        base_info = {
+            "发票文件": invoice.filename,
+            "页码": invoice.page_number,
+            "区域": invoice.region,
+            "发票类型": invoice.invoice_type,
+            "发票号码": invoice.invoice_number,
+            "开票日期": invoice.invoice_date,
+            "购买方名称": invoice.buyer_name,
+            "购买方税号": invoice.buyer_tax_id,
+            "销售方名称": invoice.seller_name,
+            "销售方税号": invoice.seller_tax_id,
+            "价税合计": invoice.total_price_and_tax,
+            "备注": invoice.comment,
+            "开票人": invoice.issuer,
+        }
 
-    def _process_single_page(self, image: Image.Image, page_num: int) -> Optional[InvoiceData]:
-        """处理单页图片"""
-        # 转换为 base64
-        image_base64 = image_to_base64(image)
+        # 如果有items，每个item创建一行
+        if invoice.items:
+            for item in invoice.items:
+                row = base_info.copy()
+                row.update(
+                    {
+                        "项目名称": item.project_name,
+                        "规格型号": item.specification,
+                        "单位": item.unit,
+                        "数量": item.quantity,
+                        "单价": item.unit_price,
+                        "金额": item.amount,
+                        "税率": item.tax_rate,
+                        "税额": item.tax_amount,
+                    }
+                )
+                rows.append(row)
+        else:
+            # 如果没有items，也保留发票基础信息
+            rows.append(base_info)
+    return rows
+
+
+def usage_to_rows(file_usage: dict[str, dict]) -> list[dict]:
+    """将每个文件的用量（BudgetTracker.summary()["files"]）转换为表格行"""
+    return [
+        {
+            "发票文件": filename,
+            "请求次数": usage["requests"],
+            "输入Token": usage["prompt_tokens"],
+            "输出Token": usage["completion_tokens"],
+            "费用(元)": usage["cost"],
+        }
+        for filename, usage in sorted(file_usage.items())
+    ]
 
-        # 调用 AI 解析
-        invoice_data = parse_invoice_from_image(image_base64)
 
-        # 检查是否是发票
-        if not invoice_data.is_invoice:
-            print(f"  → 第 {page_num} 页不是发票，已忽略")
-            return None
+def write_excel(invoices: list[InvoiceData], excel_path: str, file_usage: Optional[dict[str, dict]] = None) -> None:
+    """将发票数据按文件名、页码和区域排序后写入Excel，提供 file_usage 时额外写入“费用统计”工作表"""
+    import pandas as pd
 
-        # 设置页码
-        invoice_data.page_number = page_num
+    with span("write", output=Path(excel_path).name, invoices=len(invoices)):
+        invoices = sorted(invoices, key=lambda x: (x.filename, x.page_number, x.region))
+        df = pd.DataFrame(invoices_to_rows(invoices))
+        if not file_usage:
+            df.to_excel(excel_path, index=False)
+            return
+        with pd.ExcelWriter(excel_path) as writer:
+            df.to_excel(writer, sheet_name="发票信息", index=False)
+            pd.DataFrame(usage_to_rows(file_usage)).to_excel(writer, sheet_name="费用统计", index=False)
 
-        return invoice_data
 
-    def _extract_one(self, pdf_path: str) -> list[InvoiceData]:
-        """提取单个 PDF 的发票数据，支持多页 PDF
+class InvoiceExtractor:
+    """PDF invoice data extractor"""
+
+    def __init__(
+        self,
+        max_workers: int = MAX_WORKERS,
+        dpi: int = DEFAULT_DPI,
+        cache_dir: Optional[str] = None,
+        budget: Optional[BudgetTracker] = None,
+        detect_regions: bool = REGION_DETECTION,
+    ):
+        """
+        Args:
+            max_workers: 同时处理的文件数
+            dpi: PDF 渲染为图片时的 DPI
+            cache_dir: 单页结果缓存目录，为 None 时不使用缓存
+            budget: token/费用预算，默认使用 config 中的预算配置
+            detect_regions: 是否检测页面上的发票区域并分别识别
+        """
+        self.max_workers = max_workers
+        self.dpi = dpi
+        self.detect_regions = detect_regions
+        self.cache = ResultCache(cache_dir) if cache_dir else None
+        self.budget = budget or BudgetTracker()
+        # 单页事件回调，参数为 PageEvent
+        self.page_callback: Optional[Callable[[PageEvent], None]] = None
+        # 最近一次运行中出错的文件及错误信息: {pdf_path: [错误信息, ...]}
+        self.errors: dict[str, list[str]] = {}
+        # 最近一次运行的页数统计
+        self.pages_processed = 0
+        self.cache_hits = 0
+        self._stats_lock = threading.Lock()
+        # 运行控制: 取消后不再提交新页面；暂停时新页面等待恢复，进行中的请求不受影响
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        # 本实例专用的 API 客户端，取消时关闭它以中断进行中的请求
+        self._client: Optional[OpenAI] = None
+        self._client_lock = threading.Lock()
+        # 文件级和页级线程池在多次运行之间复用；页任务只在页线程池中执行，文件任务等待页任务不会死锁
+        self._file_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="invoice-file")
+        self._page_pool = ThreadPoolExecutor(max_workers=max_workers * PAGE_WORKERS, thread_name_prefix="invoice-page")
+
+    def close(self) -> None:
+        """关闭线程池"""
+        self._file_pool.shutdown(wait=True)
+        self._page_pool.shutdown(wait=True)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._resume_event.is_set()
+
+    def cancel(self) -> None:
+        """取消当前运行：排队中的页面不再发送请求，进行中的请求通过关闭客户端中断，可从任意线程调用
+
+        取消状态会一直保持（运行开始前调用同样有效），取消后要复用同一个实例需先调用 reset()。
+        """
+        self._cancel_event.set()
+        # 唤醒暂停中的任务，让它们尽快退出
+        self._resume_event.set()
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    def reset(self) -> None:
+        """清除取消和暂停状态，使已取消的实例可以开始新的运行"""
+        self._cancel_event.clear()
+        self._resume_event.set()
+
+    def pause(self) -> None:
+        """暂停：尚未开始的页面等待 resume()，进行中的请求会正常完成"""
+        self._resume_event.clear()
+
+    def resume(self) -> None:
+        self._resume_event.set()
+
+    def _checkpoint(self) -> None:
+        """开始新的工作前调用：暂停时等待恢复，已取消时抛出 ExtractionCancelled"""
+        self._resume_event.wait()
+        if self._cancel_event.is_set():
+            raise ExtractionCancelled("已取消")
+
+    def _get_client(self) -> OpenAI:
+        """返回本实例的客户端；已取消时抛出 ExtractionCancelled，而不是新建一个 cancel() 无法关闭的客户端"""
+        with self._client_lock:
+            if self._cancel_event.is_set():
+                raise ExtractionCancelled("已取消")
+            if self._client is None:
+                from openai import OpenAI
+
+                self._client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+            return self._client
+
+    def _emit(self, event: PageEvent) -> None:
+        if self.page_callback is None:
+            return
+        try:
+            self.page_callback(event)
+        except Exception as e:
+            print(f"  ✗ 页面事件回调出错: {e}")
+
+    def _process_single_page(
+        self, image: Image.Image, page_num: int, filename: str = ""
+    ) -> tuple[list[InvoiceData], bool]:
+        """处理单页图片
 
         Returns:
-            发票数据列表，每页一个 InvoiceData（如果是发票的话）
+            (该页识别到的发票（一页可能有多张）, 是否按正常质量处理)；省钱模式下降低 DPI/换用便宜模型
+            或跳过空白页的结果不是正常质量，不应写入按正常 DPI 和模型计算的缓存
+
+        启用区域检测时，页面上每个发票区域分别裁剪后发送；区域在同一个页任务中依次请求，
+        不再向页线程池提交子任务，避免线程池被等待子任务的页任务占满。
+        预算接近上限时降低图片 DPI、换用便宜模型并跳过空白页；预算用完时抛出 BudgetExceeded。
+        暂停时等待恢复，已取消时抛出 ExtractionCancelled。
         """
-        # 将 PDF 转换为图片列表
-        images = pdf_to_images(pdf_path)
-        print(f"  → PDF 共 {len(images)} 页")
-
-        results = []
-
-        # 并发处理所有页面，并发度为 5
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            # 提交所有任务
-            future_to_page = {
-                executor.submit(self._process_single_page, image, idx): idx
-                for idx, image in enumerate(images, 1)
+        with span("page", file=filename, page=page_num):
+            self._checkpoint()
+            # check() 为本页第一个请求预留了用量，没有发送请求或请求失败时要 release()
+            economy = self.budget.check() == BUDGET_ECONOMY
+            try:
+                skip = economy and is_blank_page(image)
+                regions = [] if skip else page_regions(image, self.detect_regions)
+            except BaseException:
+                self.budget.release()
+                raise
+            if skip:
+                self.budget.release()
+                print(f"  → 第 {page_num} 页基本空白，省钱模式下已跳过")
+                return [], False
+
+            invoices = []
+            full_quality = True
+            for region, region_image in enumerate(regions, 1):
+                if region > 1:
+                    self._checkpoint()
+                    economy = self.budget.check() == BUDGET_ECONOMY
+                try:
+                    model = DEEPSEEK_MODEL
+                    if economy:
+                        region_image = scale_to_dpi(region_image, self.dpi, ECONOMY_DPI)
+                        model = DEEPSEEK_ECONOMY_MODEL
+                        full_quality = False
+
+                    # 转换为 base64
+                    image_base64 = image_to_base64(region_image)
+
+                    # 调用 AI 解析；区域检测和编码可能耗时较长，发送前再检查一次暂停/取消
+                    self._checkpoint()
+                    try:
+                        invoice_data = parse_invoice_from_image(image_base64, client=self._get_client(), model=model)
+                    except Exception:
+                        # 取消时客户端被关闭，进行中的请求会以连接错误结束，不算作页面错误
+                        if self._cancel_event.is_set():
+                            raise ExtractionCancelled("已取消") from None
+                        raise
+                except BaseException:
+                    self.budget.release()
+                    raise
+                self.budget.record(filename, invoice_data.prompt_tokens, invoice_data.completion_tokens)
+
+                # 检查是否是发票
+                if not invoice_data.is_invoice:
+                    continue
+
+                # 设置页码和页内序号
+                invoice_data.page_number = page_num
+                invoice_data.region = len(invoices) + 1
+                invoices.append(invoice_data)
+
+            if not invoices:
+                print(f"  → 第 {page_num} 页不是发票，已忽略")
+            return invoices, full_quality
+
+    @property
+    def cache_layout(self) -> str:
+        """缓存键中的版面处理方式，按区域裁剪与发送整页的结果分别缓存"""
+        return REGION_LAYOUT if self.detect_regions else ""
+
+    def _load_cached_pages(
+        self, pdf_path: str, file_hash: Optional[str] = None
+    ) -> tuple[dict[int, str], dict[int, list[InvoiceData]]]:
+        """查询缓存，返回 (每页的缓存键, 已命中页的结果)；调用方已算出文件哈希时传入 file_hash，避免重复读取文件"""
+        with span("cache_lookup", file=Path(pdf_path).name):
+            file_hash = file_hash or file_sha256(pdf_path)
+            keys = {
+                page_num: ResultCache.make_key(file_hash, page_num, self.dpi, DEEPSEEK_MODEL, self.cache_layout)
+                for page_num in range(1, pdf_page_count(pdf_path) + 1)
             }
+            cached = {}
+            for page_num, key in keys.items():
+                hit = self.cache.get(key)  # type: ignore[union-attr]
+                if hit is not None:
+                    cached[page_num] = [invoice_from_dict(data) for data in hit]
+        return keys, cached
 
-            # 按完成顺序收集结果
-            for future in as_completed(future_to_page):
-                page_num = future_to_page[future]
-                try:
-                    invoice_data = future.result()
-                    if invoice_data is not None:
-                        results.append(invoice_data)
-                        print(f"  ✓ 第 {page_num} 页处理完成，识别到发票")
-                except Exception as e:
-                    print(f"  ✗ 处理第 {page_num} 页时出错: {e}")
+    def _extract_one(self, pdf_path: str) -> list[InvoiceData]:
+        """提取单个 PDF 的发票数据，支持多页 PDF
+
+        单页出错不会中断整个文件，错误会记录到 self.errors 中。
+        启用缓存时只渲染和解析未命中缓存的页。
 
+        Returns:
+            发票数据列表，每张发票一个 InvoiceData（一页可能有多张）
+        """
+        results: list[InvoiceData] = []
+        filename = Path(pdf_path).name
+        self._checkpoint()
+
+        if self.cache is None:
+            # 将 PDF 转换为图片列表
+            cache_keys: dict[int, str] = {}
+            pages = list(enumerate(pdf_to_images(pdf_path, self.dpi), 1))
+            total_pages = len(pages)
+            print(f"  → PDF 共 {total_pages} 页")
+        else:
+            cache_keys, cached = self._load_cached_pages(pdf_path)
+            total_pages = len(cache_keys)
+            for page_num, page_results in cached.items():
+                results.extend(page_results)
+                invoice = page_results[0] if page_results else None
+                self._emit(PageEvent(filename, page_num, total_pages, "cached", invoice, invoices=page_results))
+            missing = [page_num for page_num in cache_keys if page_num not in cached]
+            pages = []
+            if missing:
+                # 只渲染覆盖所有未命中页的最小页码范围
+                images = pdf_to_images(pdf_path, self.dpi, first_page=missing[0], last_page=missing[-1])
+                pages = [(page_num, image) for page_num, image in enumerate(images, missing[0]) if page_num in missing]
+            with self._stats_lock:
+                self.cache_hits += len(cached)
+            print(f"  → PDF 共 {total_pages} 页，缓存命中 {len(cached)} 页")
+
+        # 并发处理所有页面
+        future_to_page = {
+            self._page_pool.submit(self._process_single_page, image, page_num, filename): page_num
+            for page_num, image in pages
+        }
+
+        # 按完成顺序收集结果
+        interrupted = False
+        for future in as_completed(future_to_page):
+            page_num = future_to_page[future]
+            try:
+                page_results, full_quality = future.result()
+                with self._stats_lock:
+                    self.pages_processed += 1
+                # 省钱模式下的结果只用于本次运行，预算充足时重新按正常质量识别
+                if self.cache is not None and full_quality:
+                    self.cache.put(cache_keys[page_num], [asdict(invoice_data) for invoice_data in page_results])
+                if page_results:
+                    results.extend(page_results)
+                    count = f" {len(page_results)} 张" if len(page_results) > 1 else ""
+                    print(f"  ✓ 第 {page_num} 页处理完成，识别到{count}发票")
+                status = "done" if page_results else "skipped"
+                invoice = page_results[0] if page_results else None
+                self._emit(PageEvent(filename, page_num, total_pages, status, invoice, invoices=page_results))
+            except ExtractionCancelled:
+                interrupted = True
+            except Exception as e:
+                print(f"  ✗ 处理第 {page_num} 页时出错: {e}")
+                self.errors.setdefault(pdf_path, []).append(f"第 {page_num} 页: {e}")
+                self._emit(PageEvent(filename, page_num, total_pages, "error", error=str(e)))
+
+        if interrupted:
+            # 未处理完的文件不计入结果；已完成的正常质量页面在启用缓存时会保留，下次运行可直接复用
+            raise ExtractionCancelled("已取消")
         return results
 
     def _extract_many(
         self, pdf_paths: list[str], progress_callback: Optional[Callable[[str, int, int], None]] = None
     ) -> list[InvoiceData]:
-        """并发提取多个PDF的发票数据，并发度为5
+        """并发提取多个PDF的发票数据，并发度为 self.max_workers
 
         Args:
             pdf_paths: PDF文件路径列表
             progress_callback: 进度回调函数，参数为(文件名, 已完成数量, 总数量)
+
+        Raises:
+            ExtractionCancelled: 运行被取消，部分结果不返回，调用方不应写出或记录任何结果
         """
         all_data = []
         total = len(pdf_paths)
         completed = 0
-
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            # 提交所有任务
-            future_to_path = {executor.submit(self._extract_one, pdf_path): pdf_path for pdf_path in pdf_paths}
-
-            # 按完成顺序收集结果
-            for future in as_completed(future_to_path):
-                pdf_path = future_to_path[future]
-                filename = pdf_path.split("/")[-1]
-                try:
-                    data_list = future.result()  # 现在返回的是列表
-                    invoice_count = 0
-                    for data in data_list:
-                        if data.is_invoice:
-                            # 为每个发票数据设置文件名（不再包含页码）
-                            data.filename = filename
-                            all_data.append(data)
-                            invoice_count += 1
-
-                    completed += 1
-                    if invoice_count > 0:
-                        print(f"✓ 已完成: {filename} - 识别到 {invoice_count} 张发票 ({completed}/{total})")
-                    else:
-                        print(f"✓ 已完成: {filename} - 未识别到发票 ({completed}/{total})")
-
-                    if progress_callback:
-                        progress_callback(filename, completed, total)
-                except Exception as e:
-                    completed += 1
-                    print(f"✗ 处理 {filename} 时出错: {e}")
-                    if progress_callback:
-                        progress_callback(filename, completed, total)
-
+        self.errors = {}
+        self.pages_processed = 0
+        self.cache_hits = 0
+        self.budget.start_run()
+
+        # 提交所有任务
+        future_to_path = {self._file_pool.submit(self._extract_one, pdf_path): pdf_path for pdf_path in pdf_paths}
+
+        # 按完成顺序收集结果
+        for future in as_completed(future_to_path):
+            pdf_path = future_to_path[future]
+            filename = Path(pdf_path).name
+            try:
+                data_list = future.result()  # 现在返回的是列表
+                invoice_count = 0
+                for data in data_list:
+                    if data.is_invoice:
+                        # 为每个发票数据设置文件名（不再包含页码）
+                        data.filename = filename
+                        data.source_path = os.path.abspath(pdf_path)
+                        all_data.append(data)
+                        invoice_count += 1
+
+                completed += 1
+                if invoice_count > 0:
+                    print(f"✓ 已完成: {filename} - 识别到 {invoice_count} 张发票 ({completed}/{total})")
+                else:
+                    print(f"✓ 已完成: {filename} - 未识别到发票 ({completed}/{total})")
+
+                if progress_callback:
+                    progress_callback(filename, completed, total)
+            except ExtractionCancelled:
+                completed += 1
+            except Exception as e:
+                completed += 1
+                print(f"✗ 处理 {filename} 时出错: {e}")
+                self.errors.setdefault(pdf_path, []).append(str(e))
+                if progress_callback:
+                    progress_callback(filename, completed, total)
+
+        if self.cancelled:
+            print(f"✗ 已取消，{len(all_data)} 张发票已识别")
+            raise ExtractionCancelled("已取消")
         return all_data
 
     def extract_to_excel(
@@ -255,63 +703,197 @@ class InvoiceExtractor:
             progress_callback: 进度回调函数，参数为(文件名, 已完成数量, 总数量)
         """
         print(f"开始处理 {len(pdf_paths)} 个PDF文件...")
+        # 取消时 _extract_many 抛出 ExtractionCancelled，不会覆盖已有的输出文件
         all_data = self._extract_many(pdf_paths, progress_callback)
+        usage = self.budget.summary()
+        write_excel(all_data, excel_path, usage["files"])
+        print(f"✓ Excel文件已保存到: {excel_path}")
+        print(f"  本次共 {usage['run']['requests']} 次请求, 费用约 {usage['run']['cost']:.4f} 元")
 
-        # 按文件名和页码排序
-        all_data.sort(key=lambda x: (x.filename, x.page_number))
-
-        # 展开数据：每个item独立成一行
-        rows = []
-        for invoice in all_data:
-            # 基础发票信息（不包含items）
-            base_info = {
-                "发票文件": invoice.filename,
-                "页码": invoice.page_number,
-                "发票类型": invoice.invoice_type,
-                "发票号码": invoice.invoice_number,
-                "开票日期": invoice.invoice_date,
-                "购买方名称": invoice.buyer_name,
-                "购买方税号": invoice.buyer_tax_id,
-                "销售方名称": invoice.seller_name,
-                "销售方税号": invoice.seller_tax_id,
-                "价税合计": invoice.total_price_and_tax,
-                "备注": invoice.comment,
-                "开票人": invoice.issuer,
-            }
+    def extract_to_store(
+        self,
+        pdf_paths: list[str],
+        store: "InvoiceStore",
+        progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    ) -> list[InvoiceData]:
+        """提取多个PDF的发票数据并写入本地发票库
 
-            # 如果有items，每个item创建一行
-            if invoice.items:
-                for item in invoice.items:
-                    row = base_info.copy()
-                    row.update(
-                        {
-                            "项目名称": item.project_name,
-                            "规格型号": item.specification,
-                            "单位": item.unit,
-                            "数量": item.quantity,
-                            "单价": item.unit_price,
-                            "金额": item.amount,
-                            "税率": item.tax_rate,
-                            "税额": item.tax_amount,
-                        }
-                    )
-                    rows.append(row)
-            else:
-                # 如果没有items，也保留发票基础信息
-                rows.append(base_info)
-
-        # 创建DataFrame并保存
-        df = pd.DataFrame(rows)
-        df.to_excel(excel_path, index=False)
-        print(f"✓ Excel文件已保存到: {excel_path}")
+        Args:
+            pdf_paths: PDF文件路径列表
+            store: 发票库实例
+            progress_callback: 进度回调函数，参数为(文件名, 已完成数量, 总数量)
+
+        Returns:
+            本次识别到的发票数据列表
+        """
+        print(f"开始处理 {len(pdf_paths)} 个PDF文件...")
+        all_data = self._extract_many(pdf_paths, progress_callback)
+        # 成功处理的文件先删除旧记录，重新处理后页数或发票数变少时不会留下过期的行；
+        # 出错的文件只覆盖识别成功的页，保留其余页的旧记录
+        store.remove_files([pdf_path for pdf_path in pdf_paths if pdf_path not in self.errors])
+        store.add_invoices(all_data)
+        print(f"✓ 已写入发票库: {store.db_path} ({len(all_data)} 张发票)")
+        return all_data
 
 
-if __name__ == "__main__":
-    extractor = InvoiceExtractor()
-    extractor.extract_to_excel(
-        pdf_paths=[
-            "/Users/zouguodong/Downloads/深圳福克森-李雨霏报销2025.10.14_20251014153857.pdf",
-            "/Users/zouguodong/Downloads/零食发票 6.pdf",
-        ],
-        excel_path="/Users/zouguodong/Downloads/发票信息统计.xlsx",
+# 命令行退出码
+EXIT_OK = 0
+EXIT_PARTIAL_FAILURE = 1  # 部分文件处理失败
+EXIT_USAGE = 2  # 参数错误或没有找到输入文件
+EXIT_FATAL = 3  # 无法写出结果等致命错误
+
+OUTPUT_FORMATS = ("xlsx", "csv", "json")
+
+
+def collect_pdf_paths(inputs: list[str]) -> list[str]:
+    """展开命令行输入：文件、目录（递归查找PDF）和 glob 模式，按出现顺序去重"""
+    paths: dict[str, None] = {}
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            matches = sorted(str(p) for p in path.rglob("*") if p.is_file() and p.suffix.lower() == ".pdf")
+        elif path.is_file():
+            matches = [item]
+        else:
+            matches = sorted(p for p in glob.glob(item, recursive=True) if Path(p).is_file())
+        for match in matches:
+            paths.setdefault(match, None)
+    return list(paths)
+
+
+def write_output(
+    invoices: list[InvoiceData], output_path: str, output_format: str, file_usage: Optional[dict[str, dict]] = None
+) -> None:
+    """按指定格式写出结果，xlsx 格式下 file_usage 会写入“费用统计”工作表"""
+    if output_format == "xlsx":
+        write_excel(invoices, output_path, file_usage)
+        return
+    invoices = sorted(invoices, key=lambda x: (x.filename, x.page_number, x.region))
+    with span("write", output=Path(output_path).name, invoices=len(invoices)):
+        if output_format == "csv":
+            import pandas as pd
+
+            # utf-8-sig 便于 Excel 直接打开
+            pd.DataFrame(invoices_to_rows(invoices)).to_csv(output_path, index=False, encoding="utf-8-sig")
+        else:
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump([asdict(invoice) for invoice in invoices], f, ensure_ascii=False, indent=2)
+
+
+def write_profile(profiler: Profiler, output_dir: str) -> dict:
+    """写出 --profile 的结果，返回写入 JSON 摘要的内容"""
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    trace_path = str(Path(output_dir) / "trace.json")
+    stacks_path = str(Path(output_dir) / "stacks.folded")
+    profiler.write_chrome_trace(trace_path)
+    profiler.write_collapsed_stacks(stacks_path)
+    spans = profiler.summary()
+    print("各阶段耗时（毫秒）:", file=sys.stderr)
+    for name, total in spans.items():
+        print(
+            f"  {name:<12} 次数 {total['count']:>5}  墙钟 {total['wall_ms']:>10.1f}  CPU {total['cpu_ms']:>10.1f}"
+            f"  最长 {total['max_ms']:>8.1f}",
+            file=sys.stderr,
+        )
+    print(f"✓ 性能记录已保存到: {trace_path}, {stacks_path}", file=sys.stderr)
+    return {"trace": trace_path, "stacks": stacks_path, "samples": profiler.samples, "spans": spans}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """命令行入口: python -m financial [选项] 文件/目录/glob ..."""
+    parser = argparse.ArgumentParser(prog="python -m financial", description="批量解析PDF发票")
+    parser.add_argument("inputs", nargs="+", help="PDF文件、目录或 glob 模式（如 'scans/**/*.pdf'）")
+    parser.add_argument("-o", "--output", help=f"输出文件路径，默认 {Path(DEFAULT_OUTPUT_FILENAME).stem}.<格式>")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, help="输出格式，默认根据输出文件扩展名判断")
+    parser.add_argument("-j", "--workers", type=int, default=MAX_WORKERS, help="同时处理的文件数")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="PDF 渲染 DPI")
+    parser.add_argument("--cache-dir", help="单页结果缓存目录，重复运行时跳过已解析的页")
+    parser.add_argument(
+        "--no-regions", action="store_true", help="不检测页面上的发票区域，整页发送（默认检测并分别识别每张发票）"
+    )
+    parser.add_argument("--store", help="同时写入的发票库路径")
+    parser.add_argument("--budget-run-cost", type=float, default=BUDGET_RUN_COST, help="本次运行费用上限（元）")
+    parser.add_argument("--budget-run-tokens", type=int, default=BUDGET_RUN_TOKENS, help="本次运行 token 上限")
+    parser.add_argument("--budget-day-cost", type=float, default=BUDGET_DAY_COST, help="当日费用上限（元）")
+    parser.add_argument("--budget-day-tokens", type=int, default=BUDGET_DAY_TOKENS, help="当日 token 上限")
+    parser.add_argument("--pause-when-exhausted", action="store_true", help="当日预算用完时暂停到第二天而不是跳过")
+    parser.add_argument("--summary", metavar="PATH", default="-", help="JSON 运行摘要输出位置，默认 '-' 为标准输出")
+    parser.add_argument(
+        "--profile", metavar="DIR", help="记录各阶段耗时，在 DIR 中写出 trace.json（Chrome trace）和 stacks.folded（火焰图）"
+    )
+    parser.add_argument(
+        "--profile-interval", type=float, default=5.0, metavar="MS", help="--profile 的调用栈采样间隔（毫秒），0 为不采样"
+    )
+    args = parser.parse_args(argv)
+
+    output_format = args.format
+    if output_format is None:
+        suffix = Path(args.output).suffix.lstrip(".").lower() if args.output else ""
+        output_format = suffix if suffix in OUTPUT_FORMATS else "xlsx"
+    output_path = args.output or f"{Path(DEFAULT_OUTPUT_FILENAME).stem}.{output_format}"
+
+    pdf_paths = collect_pdf_paths(args.inputs)
+    if not pdf_paths:
+        print("✗ 没有找到PDF文件", file=sys.stderr)
+        return EXIT_USAGE
+
+    started = time.perf_counter()
+    budget = BudgetTracker(
+        run_tokens=args.budget_run_tokens,
+        run_cost=args.budget_run_cost,
+        day_tokens=args.budget_day_tokens,
+        day_cost=args.budget_day_cost,
+        pause_when_exhausted=args.pause_when_exhausted,
     )
+    extractor = InvoiceExtractor(
+        max_workers=args.workers,
+        dpi=args.dpi,
+        cache_dir=args.cache_dir,
+        budget=budget,
+        detect_regions=REGION_DETECTION and not args.no_regions,
+    )
+    profiler = Profiler(args.profile_interval / 1000) if args.profile else None
+    # 处理日志输出到标准错误，标准输出只保留 JSON 摘要
+    with contextlib.redirect_stdout(sys.stderr), profiler or contextlib.nullcontext():
+        print(f"开始处理 {len(pdf_paths)} 个PDF文件...")
+        invoices = extractor._extract_many(pdf_paths)
+        try:
+            write_output(invoices, output_path, output_format, budget.summary()["files"])
+            if args.store:
+                from invoice_store import InvoiceStore
+
+                store = InvoiceStore(args.store)
+                store.remove_files([pdf_path for pdf_path in pdf_paths if pdf_path not in extractor.errors])
+                store.add_invoices(invoices)
+        except Exception as e:
+            print(f"✗ 写出结果失败: {e}")
+            exit_code = EXIT_FATAL
+        else:
+            print(f"✓ 结果已保存到: {output_path}")
+            exit_code = EXIT_PARTIAL_FAILURE if extractor.errors else EXIT_OK
+
+    summary = {
+        "exit_code": exit_code,
+        "output": output_path,
+        "format": output_format,
+        "files": len(pdf_paths),
+        "failed_files": len(extractor.errors),
+        "invoices": len(invoices),
+        "pages_processed": extractor.pages_processed,
+        "cache_hits": extractor.cache_hits,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "errors": extractor.errors,
+        "usage": budget.summary(),
+    }
+    if profiler is not None:
+        summary["profile"] = write_profile(profiler, args.profile)
+    summary_json = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary == "-":
+        print(summary_json)
+    else:
+        Path(args.summary).write_text(summary_json, encoding="utf-8")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Incremental folder sync: only process new or changed PDFs"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+
+from financial import InvoiceData, InvoiceExtractor, invoices_to_rows
+from result_cache import file_sha256
+
+MANIFEST_VERSION = 1
+
+# 读取已有Excel时需要保持为字符串的列，避免发票号码、税号被转成数字
+TEXT_COLUMNS = {"发票文件": str, "发票号码": str, "购买方税号": str, "销售方税号": str}
+
+
+@dataclass
+class SyncResult:
+    """一次增量同步的结果"""
+
+    added: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+    invoice_count: int = 0
+
+
+def manifest_path_for(excel_path: str) -> Path:
+    """清单文件与输出Excel放在同一目录下"""
+    excel = Path(excel_path)
+    return excel.with_name(f".{excel.name}.manifest.json")
+
+
+def load_manifest(path: Path) -> dict[str, dict]:
+    """读取清单，文件不存在或版本不符时返回空清单"""
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(path: Path, files: dict[str, dict]) -> None:
+    """原子写入清单，避免中途退出时留下损坏的文件"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(
+        json.dumps({"version": MANIFEST_VERSION, "files": files}, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    os.replace(tmp_path, path)
+
+
+def scan_pdfs(folder: str) -> list[Path]:
+    """列出目录下（不含子目录）的所有PDF文件"""
+    return sorted(p for p in Path(folder).iterdir() if p.is_file() and p.suffix.lower() == ".pdf")
+
+
+def merge_into_workbook(excel_path: str, invoices: list[InvoiceData], replace_files: set[str]) -> None:
+    """将新的发票数据合并到已有Excel中
+
+    Args:
+        excel_path: Excel文件路径，不存在时直接新建
+        invoices: 新增的发票数据
+        replace_files: 需要先从Excel中移除的文件名（修改或删除的文件）
+    """
+    new_df = pd.DataFrame(invoices_to_rows(invoices))
+    if Path(excel_path).exists():
+        existing = pd.read_excel(excel_path, dtype=TEXT_COLUMNS)
+        if replace_files and "发票文件" in existing.columns:
+            existing = existing[~existing["发票文件"].isin(replace_files)]
+        frames = [df for df in (existing, new_df) if not df.empty]
+        df = pd.concat(frames, ignore_index=True) if frames else existing
+    else:
+        df = new_df
+
+    if not df.empty:
+        # 旧版本生成的Excel没有“区域”列，其中的每一行都是整页识别的结果
+        if "区域" in df.columns:
+            df["区域"] = df["区域"].fillna(1).astype(int)
+        sort_columns = [column for column in ("发票文件", "页码", "区域") if column in df.columns]
+        df = df.sort_values(sort_columns, kind="stable", ignore_index=True)
+
+    # 先写临时文件再替换，避免写入失败时丢失已有数据
+    tmp_path = Path(excel_path).with_name(f".{Path(excel_path).name}.tmp.xlsx")
+    df.to_excel(tmp_path, index=False)
+    os.replace(tmp_path, excel_path)
+
+
+def sync_folder(
+    extractor: InvoiceExtractor,
+    folder: str,
+    excel_path: str,
+    progress_callback: Optional[Callable[[str, int, int], None]] = None,
+) -> SyncResult:
+    """增量同步目录下的PDF到Excel
+
+    对比清单中记录的大小/修改时间（不一致时再比对哈希），只处理新增或修改过的PDF，
+    并从Excel中移除已删除文件对应的行。处理出错的文件不会写入清单，下次同步时会重试。
+
+    Args:
+        extractor: 发票提取器
+        folder: PDF所在目录
+        excel_path: 输出Excel文件路径
+        progress_callback: 进度回调函数，参数为(文件名, 已完成数量, 总数量)
+    """
+    manifest_path = manifest_path_for(excel_path)
+    # 清单与Excel必须成对存在，否则视为首次同步
+    old_files = load_manifest(manifest_path) if Path(excel_path).exists() else {}
+    new_files: dict[str, dict] = {}
+    result = SyncResult()
+    to_process: list[Path] = []
+
+    for pdf in scan_pdfs(folder):
+        stat = pdf.stat()
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        previous = old_files.get(pdf.name)
+
+        if previous and previous["size"] == entry["size"] and previous["mtime_ns"] == entry["mtime_ns"]:
+            new_files[pdf.name] = previous
+            result.unchanged.append(pdf.name)
+            continue
+
+        entry["sha256"] = file_sha256(pdf)
+        if previous and previous.get("sha256") == entry["sha256"]:
+            # 内容未变，只是修改时间变了（例如被复制或 touch 过）
+            new_files[pdf.name] = entry
+            result.unchanged.append(pdf.name)
+            continue
+
+        (result.modified if previous else result.added).append(pdf.name)
+        new_files[pdf.name] = entry
+        to_process.append(pdf)
+
+    result.removed = sorted(set(old_files) - set(new_files))
+    print(
+        f"增量同步: 新增 {len(result.added)} 个, 修改 {len(result.modified)} 个, "
+        f"删除 {len(result.removed)} 个, 未变化 {len(result.unchanged)} 个"
+    )
+
+    if not to_process and not result.removed and Path(excel_path).exists():
+        print("✓ 没有需要处理的文件")
+        return result
+
+    invoices: list[InvoiceData] = []
+    if to_process:
+        invoices = extractor._extract_many([str(pdf) for pdf in to_process], progress_callback)
+        for pdf_path in extractor.errors:
+            name = Path(pdf_path).name
+            result.failed.append(name)
+            new_files.pop(name, None)
+    result.invoice_count = len(invoices)
+
+    # 重新处理的文件（包括上次失败后重试的新增文件）都要先移除旧行
+    replace_files = {pdf.name for pdf in to_process} | set(result.removed)
+    merge_into_workbook(excel_path, invoices, replace_files)
+    save_manifest(manifest_path, new_files)
+    print(f"✓ Excel文件已更新: {excel_path}")
+    return result
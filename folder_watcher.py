@@ -0,0 +1,276 @@
+"""Watch-folder daemon: continuously ingest PDFs dropped into an inbox folder"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from config import DEFAULT_STORE_FILENAME, MAX_WORKERS
+from financial import InvoiceData, InvoiceExtractor
+from folder_sync import load_manifest, manifest_path_for, merge_into_workbook, save_manifest, scan_pdfs
+from invoice_store import InvoiceStore
+
+# inotify 常量，见 <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+# 处理失败的文件在内容不变时的重试间隔（秒），每次失败加倍，直到上限
+RETRY_INITIAL_SECONDS = 60.0
+RETRY_MAX_SECONDS = 3600.0
+
+
+class InotifyWatch:
+    """基于 Linux inotify 的目录监听，只返回有变化的文件名"""
+
+    def __init__(self, folder: str):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("当前平台不支持 inotify")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch 失败: {folder}")
+
+    def read_changes(self, timeout: float) -> set[str]:
+        """等待最多 timeout 秒，返回期间有变化的文件名"""
+        names: set[str] = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return names
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(buffer):
+            _, _, _, name_len = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """监听收件目录，将新放入的PDF送入提取流程并追加到输出Excel/发票库
+
+    文件大小和修改时间在 settle_seconds 内保持不变才会被处理，避免读到写了一半的扫描件；
+    同时处理的文件数不超过 max_workers。已处理的文件记录在输出旁边的清单中，重启后不会重复处理。
+    """
+
+    def __init__(
+        self,
+        extractor: InvoiceExtractor,
+        inbox: str,
+        excel_path: Optional[str] = None,
+        store: Optional[InvoiceStore] = None,
+        max_workers: int = MAX_WORKERS,
+        settle_seconds: float = 5.0,
+        poll_interval: float = 2.0,
+        flush_interval: float = 10.0,
+    ):
+        if excel_path is None and store is None:
+            raise ValueError("excel_path 和 store 至少需要指定一个")
+        self.extractor = extractor
+        self.inbox = inbox
+        self.excel_path = excel_path
+        self.store = store
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self.manifest_path = manifest_path_for(excel_path or store.db_path)  # type: ignore[union-attr]
+        self.manifest = load_manifest(self.manifest_path)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # 等待文件写完的候选: {文件名: (大小, 修改时间, 稳定开始时间)}
+        self._pending: dict[str, tuple[int, int, float]] = {}
+        self._in_flight: dict[str, Future] = {}
+        # 已完成但尚未写入输出的结果: [(文件名, 清单条目, 发票数据, 是否出错)]
+        self._done: list[tuple[str, dict, list[InvoiceData], bool]] = []
+        # 处理失败的文件: {文件名: (大小, 修改时间, 下次重试时间, 重试间隔)}，文件变化后立即重试
+        self._failed: dict[str, tuple[int, int, float, float]] = {}
+        self._last_flush = time.monotonic()
+
+    def stop(self) -> None:
+        """请求停止，正在处理的文件会处理完并写入输出"""
+        self._stop.set()
+
+    def run(self) -> None:
+        """阻塞运行，直到调用 stop()"""
+        try:
+            watch: Optional[InotifyWatch] = InotifyWatch(self.inbox)
+            print(f"开始监听目录 (inotify): {self.inbox}")
+        except OSError as e:
+            watch = None
+            print(f"inotify 不可用 ({e})，改为每 {self.poll_interval} 秒轮询: {self.inbox}")
+
+        # 启动时先扫描一次，处理监听开始前已经存在的文件
+        self._add_candidates(p.name for p in scan_pdfs(self.inbox))
+        try:
+            while not self._stop.is_set():
+                if watch is not None:
+                    self._add_candidates(watch.read_changes(self.poll_interval))
+                else:
+                    self._stop.wait(self.poll_interval)
+                    self._add_candidates(p.name for p in scan_pdfs(self.inbox))
+                self._submit_settled()
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    self._flush()
+        finally:
+            if watch is not None:
+                watch.close()
+            self._executor.shutdown(wait=True)
+            self._flush()
+            print("✓ 监听已停止")
+
+    def _add_candidates(self, names) -> None:
+        now = time.monotonic()
+        for name in names:
+            if not name.lower().endswith(".pdf") or name in self._in_flight:
+                continue
+            try:
+                stat = (Path(self.inbox) / name).stat()
+            except FileNotFoundError:
+                self._pending.pop(name, None)
+                continue
+            known = self.manifest.get(name)
+            if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            failed = self._failed.get(name)
+            if failed and failed[:2] == (stat.st_size, stat.st_mtime_ns) and now < failed[2]:
+                continue
+            previous = self._pending.get(name)
+            if previous is None or previous[:2] != (stat.st_size, stat.st_mtime_ns):
+                self._pending[name] = (stat.st_size, stat.st_mtime_ns, now)
+
+    def _submit_settled(self) -> None:
+        # 候选文件需要再次确认大小未变化；到了重试时间的失败文件重新加入候选（inotify 模式下不会再收到它们的事件）
+        self._add_candidates([*self._pending, *self._failed])
+        now = time.monotonic()
+        for name, (size, mtime_ns, since) in list(self._pending.items()):
+            if size == 0 or now - since < self.settle_seconds:
+                continue
+            del self._pending[name]
+            entry = {"size": size, "mtime_ns": mtime_ns}
+            print(f"→ 新文件: {name}")
+            self._in_flight[name] = self._executor.submit(self._process, name, entry)
+
+    def _process(self, name: str, entry: dict) -> None:
+        failed = False
+        pdf_path = str(Path(self.inbox) / name)
+        try:
+            invoices = self.extractor._extract_one(pdf_path)
+        except Exception as e:
+            invoices = []
+            failed = True
+            print(f"✗ 处理 {name} 时出错: {e}")
+        # _extract_one 只把单页错误记录到 extractor.errors 而不抛出；每个文件处理完就取出它的错误，
+        # 避免常驻进程中 errors 无限增长。有页面出错时整个文件按失败处理，不写入清单，之后会重试
+        page_errors = self.extractor.errors.pop(pdf_path, [])
+        if page_errors and not failed:
+            invoices = []
+            failed = True
+            print(f"✗ 处理 {name} 时有 {len(page_errors)} 页出错: {page_errors[0]}")
+        for invoice in invoices:
+            invoice.filename = name
+            invoice.source_path = os.path.abspath(pdf_path)
+        if not failed:
+            print(f"✓ 已完成: {name} - 识别到 {len(invoices)} 张发票")
+        with self._lock:
+            self._done.append((name, entry, invoices, failed))
+
+    def _flush(self) -> None:
+        """将已完成的结果批量写入输出，减少重写Excel的次数"""
+        self._last_flush = time.monotonic()
+        with self._lock:
+            done, self._done = self._done, []
+        if not done:
+            return
+
+        invoices = [invoice for _, _, file_invoices, _ in done for invoice in file_invoices]
+        names = {name for name, _, _, _ in done}
+        try:
+            if self.store is not None:
+                self.store.remove_files(sorted(str(Path(self.inbox) / name) for name in names))
+                self.store.add_invoices(invoices)
+            if self.excel_path is not None:
+                merge_into_workbook(self.excel_path, invoices, names)
+        except Exception as e:
+            # 输出被占用（如 Excel 正在打开）或磁盘错误时保留这批结果，下次写入时重试；写入按文件整体替换，可以重复执行
+            with self._lock:
+                self._done[:0] = done
+            print(f"✗ 写入输出失败，将在下次写入时重试: {e}")
+            return
+
+        for name, entry, _, failed in done:
+            self._in_flight.pop(name, None)
+            # 出错的文件不写入清单；内容不变时按递增的间隔重试，文件变化或重启后立即重试
+            if failed:
+                previous = self._failed.get(name)
+                delay = min(previous[3] * 2, RETRY_MAX_SECONDS) if previous else RETRY_INITIAL_SECONDS
+                self._failed[name] = (entry["size"], entry["mtime_ns"], time.monotonic() + delay, delay)
+                print(f"  {name} 将在 {delay:.0f} 秒后或文件变化时重试")
+            else:
+                self._failed.pop(name, None)
+                self.manifest[name] = entry
+        save_manifest(self.manifest_path, self.manifest)
+        print(f"✓ 已写入 {len(names)} 个文件, {len(invoices)} 张发票")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="监听收件目录并持续解析发票")
+    parser.add_argument("inbox", help="监听的PDF目录")
+    parser.add_argument("-o", "--output", help="追加写入的Excel文件")
+    parser.add_argument("--store", nargs="?", const=DEFAULT_STORE_FILENAME, help="写入的发票库路径")
+    parser.add_argument("-j", "--workers", type=int, default=MAX_WORKERS, help="同时处理的文件数")
+    parser.add_argument("--settle", type=float, default=5.0, help="文件多少秒未变化视为写入完成")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="轮询/检查间隔（秒）")
+    parser.add_argument("--flush-interval", type=float, default=10.0, help="批量写入输出的间隔（秒）")
+    args = parser.parse_args(argv)
+
+    if not args.output and not args.store:
+        parser.error("请至少指定 --output 或 --store")
+
+    watcher = FolderWatcher(
+        InvoiceExtractor(),
+        args.inbox,
+        excel_path=args.output,
+        store=InvoiceStore(args.store) if args.store else None,
+        max_workers=args.workers,
+        settle_seconds=args.settle,
+        poll_interval=args.poll_interval,
+        flush_interval=args.flush_interval,
+    )
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    signal.signal(signal.SIGINT, lambda *_: watcher.stop())
+    watcher.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,55 +1,264 @@
 """PyQt6 GUI for Invoice Extractor"""
 
-import sys
-from pathlib import Path
-
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QFont, QIcon
-from PyQt6.QtWidgets import (
+import time
+
+# 尽早记录启动时间，用于统计窗口显示耗时
+_STARTUP_BEGIN = time.perf_counter()
+
+import os  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+from PyQt6.QtCore import (  # noqa: E402
+    QAbstractTableModel,
+    QModelIndex,
+    QObject,
+    Qt,
+    QThread,
+    QTimer,
+    pyqtSignal,
+)
+from PyQt6.QtGui import QFont, QIcon  # noqa: E402
+from PyQt6.QtWidgets import (  # noqa: E402
+    QAbstractItemView,
     QApplication,
     QFileDialog,
     QHBoxLayout,
+    QHeaderView,
     QLabel,
-    QListWidget,
     QMainWindow,
     QMessageBox,
+    QPlainTextEdit,
     QProgressBar,
     QPushButton,
-    QTextEdit,
+    QTableView,
     QVBoxLayout,
     QWidget,
 )
 
-from config import DEFAULT_OUTPUT_FILENAME
-from financial import InvoiceExtractor
+from config import DEFAULT_OUTPUT_FILENAME  # noqa: E402
+
+# 日志最多保留的行数，超出后丢弃最早的行
+LOG_MAX_LINES = 5000
+# 日志刷新间隔（毫秒），期间的多条日志合并为一次界面更新
+LOG_FLUSH_INTERVAL_MS = 16
+# 后台扫描文件夹时每批发送给界面的文件数
+SCAN_BATCH_SIZE = 500
+
+
+class PdfFileModel(QAbstractTableModel):
+    """待处理的 PDF 文件列表，用集合去重，按批插入以支持上万个文件"""
+
+    HEADERS = ("文件名", "所在目录")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._paths: list[str] = []
+        self._known: set[str] = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._paths)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self._paths[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return os.path.basename(path) if index.column() == 0 else os.path.dirname(path)
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return path
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def add_paths(self, paths: list[str]) -> int:
+        """添加文件，已存在的路径会被忽略，返回实际新增的数量"""
+        new_paths = []
+        for path in paths:
+            path = os.path.abspath(path)
+            if path not in self._known:
+                self._known.add(path)
+                new_paths.append(path)
+        if new_paths:
+            first = len(self._paths)
+            self.beginInsertRows(QModelIndex(), first, first + len(new_paths) - 1)
+            self._paths.extend(new_paths)
+            self.endInsertRows()
+        return len(new_paths)
+
+    def clear(self):
+        self.beginResetModel()
+        self._paths.clear()
+        self._known.clear()
+        self.endResetModel()
+
+    def paths(self) -> list[str]:
+        return list(self._paths)
+
+
+class FolderScanThread(QThread):
+    """在后台递归查找文件夹中的 PDF 文件，分批发送结果，避免大目录阻塞界面"""
+
+    found = pyqtSignal(list)  # 找到一批文件: [路径, ...]
+    done = pyqtSignal(int)  # 扫描结束: (找到的文件总数)
+
+    def __init__(self, folders: list[str]):
+        super().__init__()
+        self.folders = folders
+
+    def run(self):
+        batch: list[str] = []
+        total = 0
+        for folder in self.folders:
+            for root, dirs, files in os.walk(folder):
+                if self.isInterruptionRequested():
+                    return
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        batch.append(os.path.join(root, name))
+                        if len(batch) >= SCAN_BATCH_SIZE:
+                            total += len(batch)
+                            self.found.emit(batch)
+                            batch = []
+        if batch:
+            total += len(batch)
+            self.found.emit(batch)
+        self.done.emit(total)
+
+
+class LogView(QPlainTextEdit):
+    """只读日志视图：消息先缓存，定时合并写入；只保留最近 LOG_MAX_LINES 行"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(LOG_MAX_LINES)
+        self._pending: list[str] = []
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush)
+
+    def add_message(self, message: str):
+        self._pending.append(message)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        if not self._pending:
+            return
+        scroll_bar = self.verticalScrollBar()
+        assert scroll_bar is not None
+        # 用户向上翻看日志时不自动滚动到底部
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum() - 4
+        # 积压过多时只写入最后 LOG_MAX_LINES 行
+        lines = self._pending[-LOG_MAX_LINES:]
+        self._pending.clear()
+        self.appendPlainText("\n".join(lines))
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def clear(self):
+        self._pending.clear()
+        super().clear()
+
+
+class EngineLoader(QObject):
+    """在后台线程中预加载解析引擎（pandas、openai、pdf2image 等），避免阻塞窗口显示"""
+
+    loaded = pyqtSignal(float)  # 加载完成信号: (耗时秒数)
+    failed = pyqtSignal(str)  # 加载失败信号: (错误信息)
+
+    def start(self):
+        threading.Thread(target=self._load, name="engine-warmup", daemon=True).start()
+
+    def _load(self):
+        begin = time.perf_counter()
+        try:
+            import financial
+
+            financial.warm_up()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.loaded.emit(time.perf_counter() - begin)
 
 
 class WorkerThread(QThread):
     """后台工作线程，避免界面卡顿"""
 
     progress = pyqtSignal(str, int, int)  # 进度信号: (文件名, 已完成, 总数)
+    page_progress = pyqtSignal(str, int, int, str)  # 单页信号: (文件名, 页码, 总页数, 状态)
     finished = pyqtSignal(str)  # 完成信号: (输出文件路径)
+    cancelled = pyqtSignal()  # 取消信号
     error = pyqtSignal(str)  # 错误信号: (错误信息)
 
     def __init__(self, pdf_paths: list[str], output_path: str):
         super().__init__()
         self.pdf_paths = pdf_paths
         self.output_path = output_path
+        self.extractor = None
+        # 解析器创建之前收到的取消/暂停请求
+        self._cancel_requested = False
+        self._pause_requested = False
+        self._control_lock = threading.Lock()
+
+    def cancel(self):
+        """取消任务：不再发送新请求，并中断进行中的请求"""
+        with self._control_lock:
+            self._cancel_requested = True
+            if self.extractor is not None:
+                self.extractor.cancel()
+
+    def set_paused(self, paused: bool):
+        """暂停或继续：暂停期间不发送新请求，进行中的请求会正常完成"""
+        with self._control_lock:
+            self._pause_requested = paused
+            if self.extractor is not None:
+                if paused:
+                    self.extractor.pause()
+                else:
+                    self.extractor.resume()
 
     def run(self):
         """在后台线程中执行提取任务"""
+        # 解析引擎按需加载；若后台预加载已完成，这里的导入几乎没有开销
+        from financial import ExtractionCancelled, InvoiceExtractor
+
         try:
             extractor = InvoiceExtractor()
+            extractor.page_callback = lambda event: self.page_progress.emit(
+                event.filename, event.page_number, event.total_pages, event.status
+            )
+            with self._control_lock:
+                self.extractor = extractor
+                if self._pause_requested:
+                    extractor.pause()
+                if self._cancel_requested:
+                    extractor.cancel()
 
             def progress_callback(filename: str, completed: int, total: int):
                 self.progress.emit(filename, completed, total)
 
-            extractor.extract_to_excel(
-                pdf_paths=self.pdf_paths,
-                excel_path=self.output_path,
-                progress_callback=progress_callback,
-            )
+            try:
+                extractor.extract_to_excel(
+                    pdf_paths=self.pdf_paths,
+                    excel_path=self.output_path,
+                    progress_callback=progress_callback,
+                )
+            finally:
+                extractor.close()
             self.finished.emit(self.output_path)
+        except ExtractionCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(str(e))
 
@@ -59,9 +268,12 @@ class MainWindow(QMainWindow):
 
     def __init__(self):
         super().__init__()
-        self.pdf_files = []
+        self.file_model = PdfFileModel(self)
         self.output_path = ""
         self.worker_thread = None
+        self.scan_threads: list[FolderScanThread] = []
+        # 本次运行的单页状态统计
+        self.page_stats: dict[str, int] = {}
 
         self.init_ui()
 
@@ -69,6 +281,8 @@ class MainWindow(QMainWindow):
         """初始化UI"""
         self.setWindowTitle("阿珍的发票解析工具")
         self.setGeometry(100, 100, 900, 700)
+        # 支持把文件或文件夹拖到窗口中
+        self.setAcceptDrops(True)
 
         # 中央部件
         central_widget = QWidget()
@@ -89,7 +303,7 @@ class MainWindow(QMainWindow):
 
         # 文件选择区域
         file_section = QVBoxLayout()
-        file_label = QLabel("1. 选择PDF发票文件:")
+        file_label = QLabel("1. 选择PDF发票文件（可拖入文件或文件夹）:")
         file_label_font = QFont()
         file_label_font.setPointSize(12)
         file_label_font.setBold(True)
@@ -97,19 +311,38 @@ class MainWindow(QMainWindow):
         file_section.addWidget(file_label)
 
         # 文件列表
-        self.file_list = QListWidget()
-        self.file_list.setMaximumHeight(150)
-        file_section.addWidget(self.file_list)
+        self.file_table = QTableView()
+        self.file_table.setModel(self.file_model)
+        self.file_table.setMaximumHeight(180)
+        self.file_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.file_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        # 固定行高和列宽模式，避免大量文件时逐行计算尺寸
+        vertical_header = self.file_table.verticalHeader()
+        assert vertical_header is not None
+        vertical_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        vertical_header.setDefaultSectionSize(22)
+        vertical_header.setVisible(False)
+        horizontal_header = self.file_table.horizontalHeader()
+        assert horizontal_header is not None
+        horizontal_header.setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        horizontal_header.resizeSection(0, 300)
+        horizontal_header.setStretchLastSection(True)
+        file_section.addWidget(self.file_table)
 
         # 文件按钮
         file_buttons = QHBoxLayout()
         self.add_files_btn = QPushButton("添加文件")
         self.add_files_btn.clicked.connect(self.add_files)
+        self.add_folder_btn = QPushButton("添加文件夹")
+        self.add_folder_btn.clicked.connect(self.add_folder)
         self.clear_files_btn = QPushButton("清空列表")
         self.clear_files_btn.clicked.connect(self.clear_files)
+        self.file_count_label = QLabel("共 0 个文件")
         file_buttons.addWidget(self.add_files_btn)
+        file_buttons.addWidget(self.add_folder_btn)
         file_buttons.addWidget(self.clear_files_btn)
         file_buttons.addStretch()
+        file_buttons.addWidget(self.file_count_label)
         file_section.addLayout(file_buttons)
 
         main_layout.addLayout(file_section)
@@ -135,14 +368,16 @@ class MainWindow(QMainWindow):
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         main_layout.addWidget(self.progress_bar)
+        self.page_status_label = QLabel("")
+        self.page_status_label.setVisible(False)
+        main_layout.addWidget(self.page_status_label)
 
         # 控制台输出区域
         console_label = QLabel("3. 处理日志:")
         console_label.setFont(file_label_font)
         main_layout.addWidget(console_label)
 
-        self.console = QTextEdit()
-        self.console.setReadOnly(True)
+        self.console = LogView()
         self.console.setStyleSheet(
             "background-color: #1e1e1e; color: #d4d4d4; font-family: Consolas, Monaco, monospace;"
         )
@@ -169,22 +404,88 @@ class MainWindow(QMainWindow):
         """
         )
         self.execute_btn.clicked.connect(self.execute)
-        main_layout.addWidget(self.execute_btn)
+
+        # 运行控制按钮，仅在处理过程中可用
+        self.pause_btn = QPushButton("暂停")
+        self.pause_btn.setCheckable(True)
+        self.pause_btn.setEnabled(False)
+        self.pause_btn.toggled.connect(self.toggle_pause)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel)
+
+        run_buttons = QHBoxLayout()
+        run_buttons.addWidget(self.execute_btn, stretch=1)
+        run_buttons.addWidget(self.pause_btn)
+        run_buttons.addWidget(self.cancel_btn)
+        main_layout.addLayout(run_buttons)
 
     def add_files(self):
         """添加PDF文件"""
         files, _ = QFileDialog.getOpenFileNames(self, "选择PDF发票文件", "", "PDF Files (*.pdf);;All Files (*)")
         if files:
-            for file in files:
-                if file not in self.pdf_files:
-                    self.pdf_files.append(file)
-                    self.file_list.addItem(Path(file).name)
-            self.log(f"已添加 {len(files)} 个文件")
+            self.add_paths(files)
+
+    def add_folder(self):
+        """添加文件夹（递归查找其中的PDF文件）"""
+        folder = QFileDialog.getExistingDirectory(self, "选择包含PDF发票的文件夹")
+        if folder:
+            self.scan_folders([folder])
+
+    def add_paths(self, paths: list[str]):
+        """添加文件到列表并记录日志"""
+        added = self.file_model.add_paths(paths)
+        self.update_file_count()
+        skipped = len(paths) - added
+        self.log(f"已添加 {added} 个文件" + (f"，跳过 {skipped} 个重复文件" if skipped else ""))
+
+    def scan_folders(self, folders: list[str]):
+        """在后台扫描文件夹，扫描结果分批加入文件列表"""
+        thread = FolderScanThread(folders)
+        thread.found.connect(self.on_scan_found)
+        thread.done.connect(lambda total: self.on_scan_done(thread, total))
+        self.scan_threads.append(thread)
+        self.log(f"正在扫描文件夹: {', '.join(folders)}")
+        thread.start()
+
+    def on_scan_found(self, paths: list[str]):
+        self.file_model.add_paths(paths)
+        self.update_file_count()
+
+    def on_scan_done(self, thread: FolderScanThread, total: int):
+        thread.wait()
+        self.scan_threads.remove(thread)
+        self.log(f"文件夹扫描完成，找到 {total} 个PDF文件")
+
+    def update_file_count(self):
+        self.file_count_label.setText(f"共 {self.file_model.rowCount()} 个文件")
+
+    def dragEnterEvent(self, event):
+        mime_data = event.mimeData()
+        if not self.is_running() and mime_data is not None and mime_data.hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        """拖入文件或文件夹：文件直接加入列表，文件夹在后台扫描"""
+        if self.is_running():
+            return
+        files, folders = [], []
+        for url in event.mimeData().urls():
+            path = url.toLocalFile()
+            if os.path.isdir(path):
+                folders.append(path)
+            elif path.lower().endswith(".pdf"):
+                files.append(path)
+        if files:
+            self.add_paths(files)
+        if folders:
+            self.scan_folders(folders)
+        event.acceptProposedAction()
 
     def clear_files(self):
         """清空文件列表"""
-        self.pdf_files.clear()
-        self.file_list.clear()
+        self.file_model.clear()
+        self.update_file_count()
         self.log("文件列表已清空")
 
     def select_output_path(self):
@@ -200,17 +501,18 @@ class MainWindow(QMainWindow):
             self.log(f"输出路径已设置: {file_path}")
 
     def log(self, message: str):
-        """输出日志到控制台"""
-        self.console.append(message)
-        # 自动滚动到底部
-        consoleBar = self.console.verticalScrollBar()
-        assert consoleBar
-        consoleBar.setValue(consoleBar.maximum())
+        """输出日志到控制台（合并刷新，自动滚动到底部）"""
+        self.console.add_message(message)
 
     def execute(self):
         """执行发票提取"""
         # 验证输入
-        if not self.pdf_files:
+        if self.scan_threads:
+            QMessageBox.warning(self, "警告", "正在扫描文件夹，请稍候！")
+            return
+
+        pdf_files = self.file_model.paths()
+        if not pdf_files:
             QMessageBox.warning(self, "警告", "请先添加PDF文件！")
             return
 
@@ -219,34 +521,114 @@ class MainWindow(QMainWindow):
             return
 
         # 禁用按钮
-        self.execute_btn.setEnabled(False)
-        self.add_files_btn.setEnabled(False)
-        self.clear_files_btn.setEnabled(False)
-        self.select_output_btn.setEnabled(False)
+        self.set_running(True)
 
         # 显示进度条
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
-        self.progress_bar.setMaximum(len(self.pdf_files))
+        self.progress_bar.setMaximum(len(pdf_files))
+        self.page_stats = {"done": 0, "skipped": 0, "cached": 0, "error": 0}
+        self.update_page_status()
+        self.page_status_label.setVisible(True)
 
         # 清空控制台
         self.console.clear()
         self.log("=" * 50)
-        self.log(f"开始处理 {len(self.pdf_files)} 个PDF文件...")
+        self.log(f"开始处理 {len(pdf_files)} 个PDF文件...")
         self.log("=" * 50)
 
         # 启动后台线程
-        self.worker_thread = WorkerThread(self.pdf_files, self.output_path)
+        self.worker_thread = WorkerThread(pdf_files, self.output_path)
         self.worker_thread.progress.connect(self.on_progress)
+        self.worker_thread.page_progress.connect(self.on_page_progress)
         self.worker_thread.finished.connect(self.on_finished)
+        self.worker_thread.cancelled.connect(self.on_cancelled)
         self.worker_thread.error.connect(self.on_error)
         self.worker_thread.start()
 
+    def set_running(self, running: bool):
+        """切换运行中/空闲状态下各按钮的可用性"""
+        self.execute_btn.setEnabled(not running)
+        self.add_files_btn.setEnabled(not running)
+        self.add_folder_btn.setEnabled(not running)
+        self.clear_files_btn.setEnabled(not running)
+        self.select_output_btn.setEnabled(not running)
+        self.pause_btn.setEnabled(running)
+        self.cancel_btn.setEnabled(running)
+        if not running:
+            self.pause_btn.blockSignals(True)
+            self.pause_btn.setChecked(False)
+            self.pause_btn.setText("暂停")
+            self.pause_btn.blockSignals(False)
+
+    def is_running(self) -> bool:
+        return self.worker_thread is not None and self.worker_thread.isRunning()
+
+    def toggle_pause(self, paused: bool):
+        """暂停/继续处理"""
+        if not self.is_running():
+            return
+        self.worker_thread.set_paused(paused)
+        self.pause_btn.setText("继续" if paused else "暂停")
+        self.log("⏸ 已暂停，进行中的页面完成后不再发送新请求" if paused else "▶ 继续处理")
+
+    def cancel(self):
+        """取消处理"""
+        if not self.is_running():
+            return
+        self.worker_thread.cancel()
+        self.pause_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(False)
+        self.log("正在取消...")
+
+    def closeEvent(self, event):
+        """关闭窗口时停止后台任务，避免继续发送请求"""
+        if self.is_running():
+            reply = QMessageBox.question(self, "确认退出", "正在处理中，确定要取消并退出吗？")
+            if reply != QMessageBox.StandardButton.Yes:
+                event.ignore()
+                return
+            self.worker_thread.cancel()
+            self.worker_thread.wait()
+        for thread in self.scan_threads:
+            thread.requestInterruption()
+            thread.wait()
+        event.accept()
+
+    def on_startup_finished(self):
+        """窗口首次显示后记录启动耗时，并开始在后台加载解析引擎"""
+        self.log(f"界面启动耗时: {(time.perf_counter() - _STARTUP_BEGIN) * 1000:.0f} ms")
+        self.engine_loader = EngineLoader()
+        self.engine_loader.loaded.connect(lambda seconds: self.log(f"解析引擎已就绪 (加载耗时 {seconds * 1000:.0f} ms)"))
+        self.engine_loader.failed.connect(lambda error: self.log(f"✗ 解析引擎加载失败: {error}"))
+        self.engine_loader.start()
+
     def on_progress(self, filename: str, completed: int, total: int):
         """进度更新"""
         self.progress_bar.setValue(completed)
         self.log(f"✓ 已完成: {filename} ({completed}/{total})")
 
+    def on_page_progress(self, filename: str, page_number: int, total_pages: int, status: str):
+        """单页进度更新"""
+        self.page_stats[status] = self.page_stats.get(status, 0) + 1
+        self.update_page_status()
+        labels = {"done": "识别到发票", "skipped": "不是发票", "cached": "使用缓存", "error": "出错"}
+        self.log(f"  {filename} 第 {page_number}/{total_pages} 页: {labels.get(status, status)}")
+
+    def update_page_status(self):
+        stats = self.page_stats
+        self.page_status_label.setText(
+            f"已处理 {sum(stats.values())} 页：发票 {stats.get('done', 0)}，非发票 {stats.get('skipped', 0)}，"
+            f"缓存 {stats.get('cached', 0)}，出错 {stats.get('error', 0)}"
+        )
+
+    def on_cancelled(self):
+        """任务已取消"""
+        self.log("=" * 50)
+        self.log("✗ 已取消，未保存Excel文件")
+        self.log("=" * 50)
+        self.set_running(False)
+
     def on_finished(self, output_path: str):
         """任务完成"""
         self.progress_bar.setValue(self.progress_bar.maximum())
@@ -256,10 +638,7 @@ class MainWindow(QMainWindow):
         self.log("=" * 50)
 
         # 恢复按钮
-        self.execute_btn.setEnabled(True)
-        self.add_files_btn.setEnabled(True)
-        self.clear_files_btn.setEnabled(True)
-        self.select_output_btn.setEnabled(True)
+        self.set_running(False)
 
         QMessageBox.information(self, "完成", f"处理完成！\n\nExcel文件已保存到:\n{output_path}")
 
@@ -270,10 +649,7 @@ class MainWindow(QMainWindow):
         self.log("=" * 50)
 
         # 恢复按钮
-        self.execute_btn.setEnabled(True)
-        self.add_files_btn.setEnabled(True)
-        self.clear_files_btn.setEnabled(True)
-        self.select_output_btn.setEnabled(True)
+        self.set_running(False)
         self.progress_bar.setVisible(False)
 
         QMessageBox.critical(self, "错误", f"处理过程中出现错误:\n\n{error_msg}")
@@ -287,6 +663,15 @@ def main():
         app.setWindowIcon(QIcon(str(icon_path)))
     window = MainWindow()
     window.show()
+    # 事件循环开始后（窗口已绘制）再执行
+    QTimer.singleShot(0, window.on_startup_finished)
+    if "--measure-startup" in sys.argv:
+        # 用于测量启动时间: 打印窗口显示耗时后立即退出
+        def report_startup():
+            print(f"startup_ms={(time.perf_counter() - _STARTUP_BEGIN) * 1000:.0f}")
+            app.quit()
+
+        QTimer.singleShot(0, report_startup)
     sys.exit(app.exec())
 
 
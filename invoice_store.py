@@ -0,0 +1,248 @@
+"""Local SQLite invoice store with indexed query API"""
+
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import DEFAULT_STORE_FILENAME
+from financial import InvoiceData, InvoiceItem, write_excel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    source_path TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    region INTEGER NOT NULL DEFAULT 1,
+    invoice_type TEXT,
+    invoice_number TEXT,
+    invoice_date TEXT,
+    buyer_name TEXT,
+    buyer_tax_id TEXT,
+    seller_name TEXT,
+    seller_tax_id TEXT,
+    total_price_and_tax REAL,
+    comment TEXT,
+    issuer TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invoice_items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    project_name TEXT,
+    specification TEXT,
+    unit TEXT,
+    quantity REAL,
+    unit_price REAL,
+    amount REAL,
+    tax_rate REAL,
+    tax_amount REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_source ON invoices(source_path, page_number, region);
+CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices(invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_seller_tax_id ON invoices(seller_tax_id);
+CREATE INDEX IF NOT EXISTS idx_invoices_buyer_tax_id ON invoices(buyer_tax_id);
+CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(invoice_date);
+CREATE INDEX IF NOT EXISTS idx_items_invoice_id ON invoice_items(invoice_id);
+"""
+
+INVOICE_COLUMNS = [
+    "filename",
+    "source_path",
+    "page_number",
+    "region",
+    "invoice_type",
+    "invoice_number",
+    "invoice_date",
+    "buyer_name",
+    "buyer_tax_id",
+    "seller_name",
+    "seller_tax_id",
+    "total_price_and_tax",
+    "comment",
+    "issuer",
+]
+
+ITEM_COLUMNS = [
+    "project_name",
+    "specification",
+    "unit",
+    "quantity",
+    "unit_price",
+    "amount",
+    "tax_rate",
+    "tax_amount",
+]
+
+
+def _month_range(month: str) -> tuple[str, str]:
+    """将 YYYY-MM 转换为 [起始日期, 下月起始日期) 区间"""
+    start = datetime.strptime(month, "%Y-%m")
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+class InvoiceStore:
+    """基于 SQLite 的本地发票库
+
+    记录按来源文件的绝对路径区分（不同目录下的同名文件互不覆盖），filename 只用于显示；
+    同一文件同一页的发票重复写入时会覆盖该页的全部旧记录（一页可以有多张发票，按区域区分），
+    发票号码、购买方/销售方税号和开票日期均建有索引。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_STORE_FILENAME):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._migrate(conn)
+            conn.executescript(SCHEMA)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """升级旧版本的发票库：增加 region、source_path 列，唯一索引改为 (来源路径, 页码, 区域)
+
+        旧记录没有来源路径，用文件名代替。
+        """
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(invoices)")}
+        if not columns:
+            return
+        if "region" not in columns:
+            conn.execute("ALTER TABLE invoices ADD COLUMN region INTEGER NOT NULL DEFAULT 1")
+            conn.execute("DROP INDEX IF EXISTS idx_invoices_source")
+        if "source_path" not in columns:
+            conn.execute("ALTER TABLE invoices ADD COLUMN source_path TEXT NOT NULL DEFAULT ''")
+            conn.execute("UPDATE invoices SET source_path = filename")
+            conn.execute("DROP INDEX IF EXISTS idx_invoices_source")
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，可在多个线程中安全调用
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def _source_of(invoice: InvoiceData) -> str:
+        """记录的来源标识：来源文件的绝对路径，未设置时退回文件名"""
+        return invoice.source_path or invoice.filename
+
+    def add_invoices(self, invoices: list[InvoiceData]) -> int:
+        """写入发票数据，返回写入条数"""
+        now = datetime.now().isoformat(timespec="seconds")
+        placeholders = ", ".join("?" for _ in INVOICE_COLUMNS)
+        item_placeholders = ", ".join("?" for _ in ITEM_COLUMNS)
+        with closing(self._connect()) as conn, conn:
+            # 先删除涉及页面的全部旧记录，重新识别后发票数量变少时不会留下多余的区域
+            conn.executemany(
+                "DELETE FROM invoices WHERE source_path = ? AND page_number = ?",
+                {(self._source_of(invoice), invoice.page_number) for invoice in invoices},
+            )
+            for invoice in invoices:
+                values = {column: getattr(invoice, column) for column in INVOICE_COLUMNS}
+                values["source_path"] = self._source_of(invoice)
+                cursor = conn.execute(
+                    f"INSERT INTO invoices ({', '.join(INVOICE_COLUMNS)}, created_at) VALUES ({placeholders}, ?)",
+                    list(values.values()) + [now],
+                )
+                conn.executemany(
+                    f"INSERT INTO invoice_items (invoice_id, position, {', '.join(ITEM_COLUMNS)}) "
+                    f"VALUES (?, ?, {item_placeholders})",
+                    [
+                        [cursor.lastrowid, position] + [getattr(item, column) for column in ITEM_COLUMNS]
+                        for position, item in enumerate(invoice.items)
+                    ],
+                )
+        return len(invoices)
+
+    def remove_files(self, paths: list[str]) -> int:
+        """删除指定来源文件的全部发票记录，返回删除条数
+
+        Args:
+            paths: 来源PDF路径，按绝对路径匹配
+        """
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.executemany(
+                "DELETE FROM invoices WHERE source_path = ?", [(os.path.abspath(path),) for path in paths]
+            )
+            return cursor.rowcount
+
+    def query(
+        self,
+        invoice_number: Optional[str] = None,
+        seller_tax_id: Optional[str] = None,
+        buyer_tax_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        month: Optional[str] = None,
+    ) -> list[InvoiceData]:
+        """按条件查询发票，所有条件之间为 AND 关系
+
+        Args:
+            invoice_number: 发票号码
+            seller_tax_id: 销售方税号
+            buyer_tax_id: 购买方税号
+            date_from: 开票日期下限（含），格式 YYYY-MM-DD
+            date_to: 开票日期上限（含），格式 YYYY-MM-DD
+            month: 开票月份，格式 YYYY-MM
+        """
+        conditions = []
+        params: list[str] = []
+        if invoice_number is not None:
+            conditions.append("invoice_number = ?")
+            params.append(invoice_number)
+        if seller_tax_id is not None:
+            conditions.append("seller_tax_id = ?")
+            params.append(seller_tax_id)
+        if buyer_tax_id is not None:
+            conditions.append("buyer_tax_id = ?")
+            params.append(buyer_tax_id)
+        if date_from is not None:
+            conditions.append("invoice_date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("invoice_date <= ?")
+            params.append(date_to)
+        if month is not None:
+            month_start, month_end = _month_range(month)
+            conditions.append("invoice_date >= ? AND invoice_date < ?")
+            params.extend([month_start, month_end])
+
+        sql = "SELECT * FROM invoices"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY filename, source_path, page_number, region"
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+            return [self._row_to_invoice(conn, row) for row in rows]
+
+    def find_by_invoice_number(self, invoice_number: str) -> list[InvoiceData]:
+        """按发票号码查询"""
+        return self.query(invoice_number=invoice_number)
+
+    def contains(self, invoice_number: str) -> bool:
+        """判断发票号码是否已入库（例如是否已报销过）"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT 1 FROM invoices WHERE invoice_number = ? LIMIT 1", (invoice_number,)).fetchone()
+        return row is not None
+
+    def export_to_excel(self, excel_path: str, **filters) -> int:
+        """将查询结果导出为Excel，筛选参数与 query 相同，返回导出的发票数量"""
+        invoices = self.query(**filters)
+        write_excel(invoices, excel_path)
+        return len(invoices)
+
+    def _row_to_invoice(self, conn: sqlite3.Connection, row: sqlite3.Row) -> InvoiceData:
+        item_rows = conn.execute(
+            f"SELECT {', '.join(ITEM_COLUMNS)} FROM invoice_items WHERE invoice_id = ? ORDER BY position",
+            (row["id"],),
+        ).fetchall()
+        items = [InvoiceItem(**dict(item_row)) for item_row in item_rows]
+        return InvoiceData(items=items, **{column: row[column] for column in INVOICE_COLUMNS})
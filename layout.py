@@ -0,0 +1,147 @@
+"""Local invoice region detection on rendered pages
+
+扫描件中常见一页 A4 上贴两三张火车票/小额发票，或者一张发票只占页面的四分之一。
+这里用投影轮廓递归切分（XY-cut）找出页面上彼此分开的发票区域，分别裁剪后再发送给 API，
+既能识别出同一页上的多张发票，也能去掉大片空白、减少图片 token。只依赖 PIL。
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# (left, top, right, bottom)，与 PIL 的 crop 参数一致
+Box = tuple[int, int, int, int]
+
+# 检测时把页面缩小到的宽度（像素），足够分辨区域之间的空白
+WORK_WIDTH = 400
+# 灰度低于该值的像素视为墨迹
+INK_THRESHOLD = 200
+# 一行/一列中墨迹像素占比低于该值时视为空白
+BLANK_RATIO = 0.002
+# 区域之间的空白至少占页面对应边长的比例，小于它的空白视为发票内部的间隔
+MIN_GAP_RATIO = 0.03
+# 切分出的每一块都至少占页面面积的比例才会切分，避免把一张发票拆成标题、表格等碎块
+MIN_REGION_RATIO = 0.06
+# 每一块沿切分方向的长度还至少占页面对应边长的比例，避免把发票抬头（二维码、标题）和表格切开
+MIN_EXTENT_RATIO = 0.12
+# 小于该面积比例的墨迹块视为噪点（页码、装订孔、扫描污点），切分时忽略
+NOISE_RATIO = 0.002
+# 裁剪时在区域四周保留的边距，占页面较短边的比例
+PADDING_RATIO = 0.01
+# 裁剪后仍占页面面积该比例以上时直接使用整页
+FULL_PAGE_RATIO = 0.85
+# 一页最多识别的区域数，超过时视为普通的多栏文档，按整页处理
+MAX_REGIONS = 6
+
+
+def _ink_mask(image: Image.Image) -> Image.Image:
+    """缩小并二值化页面，墨迹为 255，背景为 0"""
+    gray = image.convert("L")
+    if gray.width > WORK_WIDTH:
+        gray = gray.resize((WORK_WIDTH, max(1, round(gray.height * WORK_WIDTH / gray.width))))
+    return gray.point(lambda value: 255 if value < INK_THRESHOLD else 0)
+
+
+def _profile(mask: Image.Image, box: Box, axis: int) -> list[float]:
+    """box 内每行（axis=0）或每列（axis=1）的墨迹占比"""
+    from PIL import Image
+
+    region = mask.crop(box)
+    size = (1, region.height) if axis == 0 else (region.width, 1)
+    return [value / 255 for value in region.resize(size, Image.BOX).getdata()]
+
+
+def _trim(mask: Image.Image, box: Box) -> Box | None:
+    """收缩到 box 内墨迹的外接矩形，没有墨迹时返回 None"""
+    bbox = mask.crop(box).getbbox()
+    if bbox is None:
+        return None
+    return box[0] + bbox[0], box[1] + bbox[1], box[0] + bbox[2], box[1] + bbox[3]
+
+
+def _split(mask: Image.Image, box: Box, axis: int, min_gap: int) -> list[Box]:
+    """按至少 min_gap 长的空白行（axis=0）或空白列（axis=1）切分 box"""
+    profile = _profile(mask, box, axis)
+    start = box[1] if axis == 0 else box[0]
+    parts = []
+    segment_start = None
+    blank_run = 0
+    for offset, ratio in enumerate(profile):
+        if ratio > BLANK_RATIO:
+            if segment_start is None:
+                segment_start = offset
+            blank_run = 0
+            continue
+        blank_run += 1
+        if segment_start is not None and blank_run >= min_gap:
+            parts.append((segment_start, offset - blank_run + 1))
+            segment_start = None
+    if segment_start is not None:
+        parts.append((segment_start, len(profile)))
+    if axis == 0:
+        return [(box[0], start + begin, box[2], start + end) for begin, end in parts]
+    return [(start + begin, box[1], start + end, box[3]) for begin, end in parts]
+
+
+def _area(box: Box) -> int:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def _xy_cut(mask: Image.Image, box: Box, depth: int = 0) -> list[Box]:
+    """递归切分：先按空白行切分，再按空白列切分，只有每一块都足够大时才切分"""
+    page_area = mask.width * mask.height
+    if depth < 4:
+        for axis in (0, 1):
+            min_gap = max(2, round((mask.height if axis == 0 else mask.width) * MIN_GAP_RATIO))
+            parts = [_trim(mask, part) for part in _split(mask, box, axis, min_gap)]
+            parts = [part for part in parts if part is not None and _area(part) >= page_area * NOISE_RATIO]
+            min_extent = (mask.height if axis == 0 else mask.width) * MIN_EXTENT_RATIO
+            if len(parts) >= 2 and all(
+                _area(part) >= page_area * MIN_REGION_RATIO and part[3 - axis] - part[1 - axis] >= min_extent
+                for part in parts
+            ):
+                return [region for part in parts for region in _xy_cut(mask, part, depth + 1)]
+    return [box]
+
+
+def detect_invoice_regions(image: Image.Image) -> list[Box]:
+    """检测页面上彼此分开的发票区域
+
+    Returns:
+        按从上到下、从左到右排列的区域（原图坐标，已加边距）；空白页返回空列表，
+        无法可靠切分（区域过多或只有一块且几乎占满整页）时返回整页
+    """
+    full_page = (0, 0, image.width, image.height)
+    mask = _ink_mask(image)
+    content = _trim(mask, (0, 0, mask.width, mask.height))
+    if content is None:
+        return []
+    regions = _xy_cut(mask, content)
+    if len(regions) > MAX_REGIONS:
+        return [full_page]
+
+    scale = image.width / mask.width
+    padding = round(min(image.width, image.height) * PADDING_RATIO)
+    boxes = [
+        (
+            max(0, round(left * scale) - padding),
+            max(0, round(top * scale) - padding),
+            min(image.width, round(right * scale) + padding),
+            min(image.height, round(bottom * scale) + padding),
+        )
+        for left, top, right, bottom in regions
+    ]
+    if len(boxes) == 1 and _area(boxes[0]) >= _area(full_page) * FULL_PAGE_RATIO:
+        return [full_page]
+    return boxes
+
+
+def crop_invoice_regions(image: Image.Image) -> list[Image.Image]:
+    """按检测到的发票区域裁剪页面，未检测到可切分的区域时返回整页"""
+    boxes = detect_invoice_regions(image)
+    if not boxes or boxes == [(0, 0, image.width, image.height)]:
+        return [image]
+    return [image.crop(box) for box in boxes]
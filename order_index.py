@@ -0,0 +1,157 @@
+"""On-disk index of order numbers across processed workbooks"""
+
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from result_cache import file_sha256
+
+DEFAULT_INDEX_PATH = str(Path.home() / ".invoice-tools" / "order_index.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workbooks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    renamed_path TEXT,
+    split_dir TEXT,
+    indexed_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_number TEXT NOT NULL,
+    path TEXT NOT NULL REFERENCES workbooks(path) ON DELETE CASCADE,
+    sheet_index INTEGER NOT NULL,
+    original_sheet TEXT NOT NULL,
+    sheet_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_number ON orders(order_number);
+CREATE INDEX IF NOT EXISTS idx_orders_path ON orders(path);
+"""
+
+
+@dataclass
+class OrderLocation:
+    """订单编号所在的工作簿和 sheet"""
+
+    order_number: str
+    path: str  # 原始工作簿
+    sheet_index: int
+    original_sheet: str  # 重命名前的 sheet 名称
+    sheet_name: str  # 重命名后的 sheet 名称（名称冲突未重命名时与原名相同）
+    renamed_path: Optional[str] = None
+    split_dir: Optional[str] = None
+
+    @property
+    def split_file(self) -> Optional[str]:
+        """拆分后该 sheet 单独的文件"""
+        return str(Path(self.split_dir) / f"{self.sheet_name}.xlsx") if self.split_dir else None
+
+
+class OrderIndex:
+    """基于 SQLite 的订单编号索引
+
+    每个工作簿记录大小、修改时间和 SHA-256；再次处理时大小和修改时间不变的文件直接跳过，
+    修改时间变了但内容没变（例如被复制或 touch）的文件只更新修改时间。
+    """
+
+    def __init__(self, db_path: str = DEFAULT_INDEX_PATH):
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def is_unchanged(self, path: str) -> bool:
+        """工作簿自上次索引后是否未改变"""
+        key = self._key(path)
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT size, mtime_ns, sha256 FROM workbooks WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) == (row["size"], row["mtime_ns"]):
+            return True
+        if stat.st_size != row["size"] or file_sha256(path) != row["sha256"]:
+            return False
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE workbooks SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, key))
+        return True
+
+    def update_workbook(
+        self,
+        path: str,
+        sha256: str,
+        orders: list[tuple[int, str, str, str]],
+        renamed_path: Optional[str] = None,
+        split_dir: Optional[str] = None,
+    ) -> None:
+        """替换一个工作簿的全部索引记录
+
+        Args:
+            path: 原始工作簿路径
+            sha256: 处理时工作簿的 SHA-256
+            orders: [(sheet 序号, 原 sheet 名称, 新 sheet 名称, 订单编号), ...]
+            renamed_path: 重命名后的工作簿路径
+            split_dir: 拆分结果所在目录
+        """
+        key = self._key(path)
+        stat = os.stat(path)
+        now = datetime.now().isoformat(timespec="seconds")
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM workbooks WHERE path = ?", (key,))
+            conn.execute(
+                "INSERT INTO workbooks (path, size, mtime_ns, sha256, renamed_path, split_dir, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, sha256, renamed_path, split_dir, now),
+            )
+            conn.executemany(
+                "INSERT INTO orders (order_number, path, sheet_index, original_sheet, sheet_name) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(order_number, key, index, original, name) for index, original, name, order_number in orders],
+            )
+
+    def remove_missing(self) -> int:
+        """删除已不存在的工作簿的记录，返回删除的工作簿数量"""
+        with closing(self._connect()) as conn, conn:
+            paths = [row["path"] for row in conn.execute("SELECT path FROM workbooks")]
+            missing = [path for path in paths if not os.path.exists(path)]
+            conn.executemany("DELETE FROM workbooks WHERE path = ?", [(path,) for path in missing])
+        return len(missing)
+
+    def find(self, order_number: str) -> list[OrderLocation]:
+        """按订单编号精确查找"""
+        return self._select("o.order_number = ?", (order_number.strip(),))
+
+    def search(self, text: str, limit: int = 100) -> list[OrderLocation]:
+        """查找包含 text 的订单编号"""
+        escaped = text.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return self._select("o.order_number LIKE ? ESCAPE '\\'", (f"%{escaped}%",), limit)
+
+    def _select(self, condition: str, params: tuple, limit: Optional[int] = None) -> list[OrderLocation]:
+        sql = (
+            "SELECT o.order_number, o.path, o.sheet_index, o.original_sheet, o.sheet_name, w.renamed_path, w.split_dir "
+            f"FROM orders o JOIN workbooks w ON w.path = o.path WHERE {condition} "
+            "ORDER BY o.order_number, o.path, o.sheet_index"
+        )
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with closing(self._connect()) as conn:
+            return [OrderLocation(**dict(row)) for row in conn.execute(sql, params)]
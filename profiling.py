@@ -0,0 +1,204 @@
+"""Opt-in profiling for the extraction pipeline: per-thread spans and stack sampling
+
+用法::
+
+    with Profiler(sample_interval=0.005) as profiler:
+        extractor._extract_many(pdf_paths)
+    profiler.write_chrome_trace("trace.json")  # chrome://tracing 或 https://ui.perfetto.dev 打开
+    profiler.write_collapsed_stacks("stacks.folded")  # flamegraph.pl / speedscope 打开
+
+未启用 Profiler 时 span() 只做一次全局变量判断，可以常驻在处理流程中。
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+# 当前启用的 Profiler，同一时间只有一个
+_active: Optional["Profiler"] = None
+
+# 线程池线程名末尾的序号，采样时合并同一线程池中的线程（invoice-page_3 → invoice-page）
+_THREAD_SUFFIX = re.compile(r"_\d+$")
+
+
+@dataclass
+class Span:
+    """一段计时区间，时间单位为纳秒"""
+
+    name: str
+    thread_id: int
+    start_ns: int
+    end_ns: int
+    # 区间内本线程实际占用的 CPU 时间；远小于墙钟时间说明在等待 IO、锁或 GIL
+    cpu_ns: int
+    args: dict = field(default_factory=dict)
+
+
+@contextmanager
+def span(name: str, **args) -> Iterator[None]:
+    """记录一段处理的耗时，未启用 Profiler 时什么也不做
+
+    Args:
+        name: 区间名称，如 rasterize / encode / request / parse / write
+        args: 附加信息（文件名、页码等），写入 trace 事件的 args
+    """
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    start_ns = time.perf_counter_ns()
+    start_cpu_ns = time.thread_time_ns()
+    try:
+        yield
+    finally:
+        profiler.add_span(
+            Span(
+                name,
+                threading.get_ident(),
+                start_ns,
+                time.perf_counter_ns(),
+                time.thread_time_ns() - start_cpu_ns,
+                args,
+            )
+        )
+
+
+class Profiler:
+    """收集 span() 记录的区间，并可选地用后台线程定时采样所有线程的调用栈
+
+    采样基于 sys._current_frames()，不需要额外依赖；采样线程本身也要获取 GIL，
+    间隔过小会拖慢被测程序，默认 5 ms。
+    """
+
+    def __init__(self, sample_interval: Optional[float] = 0.005):
+        """
+        Args:
+            sample_interval: 调用栈采样间隔（秒），为 None 或 0 时只记录 span
+        """
+        self.sample_interval = sample_interval
+        self.spans: list[Span] = []
+        # 折叠后的调用栈 → 采样次数
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.thread_names: dict[int, str] = {}
+        self.started_ns = 0
+        self.stopped_ns = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        global _active
+        if _active is not None:
+            raise RuntimeError("已有 Profiler 在运行")
+        self.started_ns = time.perf_counter_ns()
+        _active = self
+        if self.sample_interval:
+            self._stop_event.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> None:
+        global _active
+        if _active is self:
+            _active = None
+        self._stop_event.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self.stopped_ns = time.perf_counter_ns()
+
+    def add_span(self, item: Span) -> None:
+        with self._lock:
+            self.spans.append(item)
+            if item.thread_id not in self.thread_names:
+                self.thread_names[item.thread_id] = threading.current_thread().name
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            collapsed = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                thread_name = _THREAD_SUFFIX.sub("", names.get(thread_id, str(thread_id)))
+                collapsed.append(";".join([thread_name, *reversed(stack)]))
+            del frames
+            with self._lock:
+                self.stacks.update(collapsed)
+                self.samples += 1
+
+    def summary(self) -> dict[str, dict]:
+        """按区间名称汇总: 次数、总墙钟时间、总 CPU 时间、最长一次（毫秒）"""
+        totals: dict[str, dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for item in spans:
+            total = totals.setdefault(item.name, {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "max_ms": 0.0})
+            wall_ms = (item.end_ns - item.start_ns) / 1e6
+            total["count"] += 1
+            total["wall_ms"] += wall_ms
+            total["cpu_ms"] += item.cpu_ns / 1e6
+            total["max_ms"] = max(total["max_ms"], wall_ms)
+        return {
+            name: {key: round(value, 3) if isinstance(value, float) else value for key, value in total.items()}
+            for name, total in sorted(totals.items(), key=lambda pair: -pair[1]["wall_ms"])
+        }
+
+    def chrome_trace(self) -> dict:
+        """Chrome trace-event 格式（每个 span 一个 "X" 事件，时间单位为微秒）"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        events: list[dict] = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}}
+            for thread_id, name in thread_names.items()
+        ]
+        for item in spans:
+            events.append(
+                {
+                    "name": item.name,
+                    "cat": "extraction",
+                    "ph": "X",
+                    "pid": pid,
+                    "tid": item.thread_id,
+                    "ts": (item.start_ns - self.started_ns) / 1000,
+                    "dur": (item.end_ns - item.start_ns) / 1000,
+                    "args": {**item.args, "cpu_ms": round(item.cpu_ns / 1e6, 3)},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+    def write_collapsed_stacks(self, path: str) -> None:
+        """写出折叠调用栈（每行 "线程;外层函数;...;内层函数 次数"），可直接交给 flamegraph.pl 或 speedscope"""
+        with self._lock:
+            stacks = sorted(self.stacks.items())
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
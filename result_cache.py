@@ -0,0 +1,56 @@
+"""On-disk cache of per-page extraction results"""
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def file_sha256(path) -> str:
+    """计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """按 (文件哈希, 页码, DPI, 模型, 版面处理方式) 缓存单页解析结果
+
+    每个条目是一个 JSON 文件，写入时先写临时文件再原子替换，
+    多个线程或进程可以安全地共享同一个缓存目录。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_hash: str, page_number: int, dpi: int, model: str, layout: str = "") -> str:
+        """layout 区分同一页的不同处理方式（如按区域裁剪），为空时与旧版本的缓存键相同"""
+        raw = f"{file_hash}:{page_number}:{dpi}:{model}"
+        if layout:
+            raw += f":{layout}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[list[dict]]:
+        """读取缓存，未命中时返回 None"""
+        try:
+            return json.loads(self._path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value: list[dict]) -> None:
+        """写入缓存"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
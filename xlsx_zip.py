@@ -0,0 +1,523 @@
+"""Zip-level xlsx helpers: split, rename and peek into workbooks without openpyxl
+
+xlsx 是一个 zip 包，每个工作表是独立的 XML 部件。这里直接在 zip 层面复制需要的部件，
+只改写 workbook.xml、关系文件和 [Content_Types].xml 中与工作表列表相关的部分，
+其余部件（样式、共享字符串、图片等）按原样复制，因此格式完全保留，也不需要解析单元格。
+读取单元格时只流式解析工作表 XML 的开头部分，读到所需范围之后就停止。
+
+XML 用正则表达式局部修改而不是 ElementTree 重新序列化，避免改变命名空间前缀
+（Excel 依赖 mc:Ignorable 中列出的前缀，重新序列化后文件会被判定为损坏）。
+"""
+
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from html import escape, unescape
+from pathlib import Path
+from typing import Optional, Union
+from xml.etree.ElementTree import iterparse
+
+CONTENT_TYPES_PART = "[Content_Types].xml"
+PACKAGE_RELS_PART = "_rels/.rels"
+
+# 按工作表区分的关系类型，拆分时只保留目标工作表自己的那一个
+SHEET_REL_TYPES = ("/worksheet", "/chartsheet", "/dialogsheet", "/macrosheet")
+# 拆分后会失效、需要删除的部件关系类型（Excel 打开时会自动重建）
+DROPPED_REL_TYPES = ("/calcChain", "/extended-properties")
+
+_ELEMENT_ATTRS = re.compile(r'([\w:]+)="([^"]*)"')
+_RELATIONSHIP = re.compile(r"<(?:\w+:)?Relationship\b[^>]*?/>")
+_SHEET_ELEMENT = re.compile(r"<(?:\w+:)?sheet\b[^>]*?/>")
+_OVERRIDE = re.compile(r"<(?:\w+:)?Override\b[^>]*?/>")
+_DEFINED_NAME = re.compile(r"<((?:\w+:)?definedName)\b([^>]*)>(.*?)</\1>", re.S)
+_DEFINED_NAMES_EMPTY = re.compile(r"<((?:\w+:)?definedNames)\b[^>]*>\s*</\1>")
+_WORKBOOK_VIEW = re.compile(r"<(?:\w+:)?workbookView\b[^>]*?/?>")
+# 公式中的工作表引用: 'Sheet 1'!A1 或 Sheet1!A1
+_SHEET_REFERENCE = re.compile(r"(?:'((?:[^']|'')+)'|([^\s'!,;()=+\-*/&^<>{}\[\]:]+))!")
+_TITLES_OF_PARTS = re.compile(r"<(?:\w+:)?TitlesOfParts\b.*?</(?:\w+:)?TitlesOfParts>", re.S)
+_LPSTR = re.compile(r"(<(?:\w+:)?lpstr>)([^<]*)(</(?:\w+:)?lpstr>)")
+_CELL_REFERENCE = re.compile(r"([A-Z]+)(\d+)")
+# Excel 不允许出现在工作表名称中的字符
+INVALID_SHEET_NAME_CHARS = re.compile(r"[\\*?:/\[\]]")
+MAX_SHEET_NAME_LENGTH = 31
+
+CellValue = Union[str, int, float, bool, None]
+
+
+@dataclass
+class SheetInfo:
+    """workbook.xml 中登记的一个工作表"""
+
+    name: str
+    index: int  # 在工作表列表中的位置，从 0 开始
+    rel_id: str
+    part: str  # 工作表部件在 zip 中的路径，如 xl/worksheets/sheet1.xml
+    element: str  # workbook.xml 中对应的 <sheet .../> 原文
+
+
+def _attrs(element: str) -> dict[str, str]:
+    """解析元素开始标签中的属性（值未反转义）"""
+    return dict(_ELEMENT_ATTRS.findall(element))
+
+
+def _local_attr(attrs: dict[str, str], name: str) -> Optional[str]:
+    """按本地名取属性，忽略命名空间前缀（如 r:id）"""
+    for key, value in attrs.items():
+        if key == name or key.endswith(f":{name}"):
+            return value
+    return None
+
+
+def rels_part_for(part: str) -> str:
+    """返回部件对应的关系文件路径，如 xl/workbook.xml -> xl/_rels/workbook.xml.rels"""
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", f"{name}.rels")
+
+
+def resolve_target(source_part: str, target: str) -> str:
+    """把关系中的 Target（相对于源部件所在目录，或以 / 开头的绝对路径）解析为 zip 内路径"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def read_relationships(parts: dict[str, bytes], source_part: str) -> list[dict[str, str]]:
+    """读取部件的关系列表，每项包含 Id、Type、Target、TargetMode 以及解析后的 part（外部链接为 None）"""
+    data = parts.get(rels_part_for(source_part) if source_part else PACKAGE_RELS_PART)
+    if data is None:
+        return []
+    relationships = []
+    for element in _RELATIONSHIP.findall(data.decode("utf-8")):
+        rel = _attrs(element)
+        rel["element"] = element
+        external = rel.get("TargetMode") == "External"
+        rel["part"] = None if external else resolve_target(source_part, unescape(rel.get("Target", "")))
+        relationships.append(rel)
+    return relationships
+
+
+def read_sheets(parts: dict[str, bytes]) -> list[SheetInfo]:
+    """按工作簿中的顺序列出所有工作表"""
+    workbook_part = find_workbook_part(parts)
+    rel_parts = {rel["Id"]: rel["part"] for rel in read_relationships(parts, workbook_part)}
+    sheets = []
+    for index, element in enumerate(_SHEET_ELEMENT.findall(parts[workbook_part].decode("utf-8"))):
+        attrs = _attrs(element)
+        rel_id = _local_attr(attrs, "id") or ""
+        sheets.append(
+            SheetInfo(
+                name=unescape(attrs.get("name", "")),
+                index=index,
+                rel_id=rel_id,
+                part=rel_parts.get(rel_id) or "",
+                element=element,
+            )
+        )
+    return sheets
+
+
+def find_workbook_part(parts: dict[str, bytes]) -> str:
+    """从包关系中找到工作簿主部件，通常是 xl/workbook.xml"""
+    for rel in read_relationships(parts, ""):
+        if rel.get("Type", "").endswith("/officeDocument") and rel["part"]:
+            return rel["part"]
+    return "xl/workbook.xml"
+
+
+def read_parts(xlsx_path: str) -> tuple[dict[str, bytes], list[zipfile.ZipInfo]]:
+    """一次性读取 zip 中的所有部件，返回 (部件内容, 原始条目信息)"""
+    with zipfile.ZipFile(xlsx_path) as zf:
+        infos = zf.infolist()
+        return {info.filename: zf.read(info) for info in infos}, infos
+
+
+def write_parts(output_path: str, parts: dict[str, bytes], infos: list[zipfile.ZipInfo]) -> None:
+    """按原始条目顺序写出部件，不在 infos 中的新部件追加在末尾"""
+    written = set()
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for info in infos:
+            if info.filename in parts:
+                zf.writestr(info.filename, parts[info.filename], compress_type=zipfile.ZIP_DEFLATED)
+                written.add(info.filename)
+        for name, data in parts.items():
+            if name not in written:
+                zf.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+    os.replace(tmp_path, output_path)
+
+
+def _reachable(parts: dict[str, bytes], roots: list[str], skip_rel=None) -> set[str]:
+    """从 roots 出发沿关系找到所有可达的部件；skip_rel(源部件, 关系) 为真时不沿该关系继续"""
+    seen: set[str] = set()
+    stack = list(roots)
+    while stack:
+        part = stack.pop()
+        if part in seen or part not in parts:
+            continue
+        seen.add(part)
+        for rel in read_relationships(parts, part):
+            if rel["part"] and not (skip_rel and skip_rel(part, rel)):
+                stack.append(rel["part"])
+    return seen
+
+
+def _is_sheet_rel(rel: dict) -> bool:
+    return rel.get("Type", "").endswith(SHEET_REL_TYPES)
+
+
+def _is_dropped_rel(rel: dict) -> bool:
+    return rel.get("Type", "").endswith(DROPPED_REL_TYPES)
+
+
+def _tokenize(data: bytes, pattern: re.Pattern) -> list[tuple[str, Optional[dict[str, str]]]]:
+    """把 XML 文本切分为 [(原文, 属性), ...]，匹配 pattern 的元素带有属性，其余文本的属性为 None"""
+    text = data.decode("utf-8")
+    tokens: list[tuple[str, Optional[dict[str, str]]]] = []
+    last = 0
+    for match in pattern.finditer(text):
+        tokens.append((text[last : match.start()], None))
+        tokens.append((match.group(0), _attrs(match.group(0))))
+        last = match.end()
+    tokens.append((text[last:], None))
+    return tokens
+
+
+def _render(tokens: list[tuple[str, Optional[dict[str, str]]]], keep) -> bytes:
+    """重新拼接 _tokenize 的结果，keep(属性) 为假的元素被删除"""
+    return "".join(text for text, attrs in tokens if attrs is None or keep(attrs)).encode("utf-8")
+
+
+class WorkbookSplitter:
+    """把一个工作簿按工作表拆分
+
+    公共部件和需要改写的 XML 在构造时只解析一次，之后每个工作表的拆分只做字符串拼接。
+    """
+
+    def __init__(self, parts: dict[str, bytes]):
+        self.parts = parts
+        self.workbook_part = find_workbook_part(parts)
+        self.sheets = [sheet for sheet in read_sheets(parts) if sheet.part in parts]
+        self.workbook_rels_part = rels_part_for(self.workbook_part)
+
+        package_roots = [
+            rel["part"] for rel in read_relationships(parts, "") if rel["part"] and not _is_dropped_rel(rel)
+        ]
+        # 所有拆分结果都需要的公共部件（工作簿、样式、共享字符串、主题等），不含任何工作表
+        self.shared = _reachable(parts, package_roots, self._skip_rel)
+        self.package_rels = _render(_tokenize(parts[PACKAGE_RELS_PART], _RELATIONSHIP), self._keep_rel)
+        self.workbook_rels_tokens = _tokenize(parts[self.workbook_rels_part], _RELATIONSHIP)
+        self.content_types_tokens = _tokenize(parts[CONTENT_TYPES_PART], _OVERRIDE)
+
+    def _skip_rel(self, source: str, rel: dict) -> bool:
+        # 不沿工作簿到各工作表的关系展开，也不保留拆分后会失效的部件
+        return _is_dropped_rel(rel) or (source == self.workbook_part and _is_sheet_rel(rel))
+
+    @staticmethod
+    def _keep_rel(rel: dict) -> bool:
+        return not _is_dropped_rel(rel)
+
+    def build(self, keep: SheetInfo) -> dict[str, bytes]:
+        """构造只包含 keep 工作表的部件集合，未涉及的部件直接引用原内容"""
+        kept = self.shared | _reachable(self.parts, [keep.part], self._skip_rel)
+        kept |= {rels_part_for(part) for part in kept if rels_part_for(part) in self.parts}
+        kept |= {CONTENT_TYPES_PART, PACKAGE_RELS_PART}
+
+        result = {name: data for name, data in self.parts.items() if name in kept}
+        result[PACKAGE_RELS_PART] = self.package_rels
+        result[self.workbook_rels_part] = _render(
+            self.workbook_rels_tokens,
+            lambda rel: self._keep_rel(rel) and (not _is_sheet_rel(rel) or rel.get("Id") == keep.rel_id),
+        )
+        result[self.workbook_part] = self._single_sheet_workbook(keep)
+        # 删除已不存在的部件的 Override 声明，否则 Excel 会提示文件损坏
+        result[CONTENT_TYPES_PART] = _render(
+            self.content_types_tokens, lambda attrs: unescape(attrs.get("PartName", "")).lstrip("/") in kept
+        )
+        return result
+
+    def _single_sheet_workbook(self, keep: SheetInfo) -> bytes:
+        """改写 workbook.xml，只保留一个工作表"""
+        # 删除其它工作表；唯一的工作表不能是隐藏状态
+        kept_element = re.sub(r'\s+state="[^"]*"', "", keep.element)
+        text = self.parts[self.workbook_part].decode("utf-8")
+        text = _SHEET_ELEMENT.sub(lambda m: kept_element if m.group(0) == keep.element else "", text)
+        # 当前选中的标签页和第一个可见标签页都指向唯一的工作表
+        text = _WORKBOOK_VIEW.sub(lambda m: re.sub(r'\s+(?:activeTab|firstSheet)="\d+"', "", m.group(0)), text)
+
+        def fix_defined_name(match: re.Match) -> str:
+            tag, attrs_text, value = match.groups()
+            attrs = _attrs(attrs_text)
+            if "localSheetId" in attrs:
+                # 工作表级名称：只保留目标工作表的，并把序号改为 0
+                if attrs["localSheetId"] != str(keep.index):
+                    return ""
+                attrs_text = re.sub(r'localSheetId="\d+"', 'localSheetId="0"', attrs_text)
+                return f"<{tag}{attrs_text}>{value}</{tag}>"
+            # 引用了其它工作表的全局名称在拆分后会失效，直接删除
+            for quoted, plain in _SHEET_REFERENCE.findall(unescape(value)):
+                if (quoted.replace("''", "'") if quoted else plain) != keep.name:
+                    return ""
+            return match.group(0)
+
+        text = _DEFINED_NAME.sub(fix_defined_name, text)
+        text = _DEFINED_NAMES_EMPTY.sub("", text)
+        return text.encode("utf-8")
+
+
+def split_workbook(
+    xlsx_path: str, output_dir: str, max_workers: Optional[int] = None
+) -> list[tuple[str, Path]]:
+    """把工作簿的每个工作表拆分为单独的 xlsx 文件，文件名为工作表名称
+
+    原文件只读取一次，每个输出文件直接由 zip 部件拼装，格式、列宽、图片等全部保留。
+    共享字符串表和样式表整体复制到每个输出文件中。
+
+    Args:
+        xlsx_path: 源工作簿路径
+        output_dir: 输出目录，不存在时自动创建
+        max_workers: 并行写出的线程数，默认由线程池决定
+
+    Returns:
+        [(工作表名称, 输出文件路径), ...]，按工作表顺序排列
+    """
+    parts, infos = read_parts(xlsx_path)
+    splitter = WorkbookSplitter(parts)
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    def write_one(sheet: SheetInfo) -> tuple[str, Path]:
+        output_path = out_dir / f"{sheet.name}.xlsx"
+        write_parts(str(output_path), splitter.build(sheet), infos)
+        return sheet.name, output_path
+
+    # zlib 压缩时会释放 GIL，多线程可以并行写出多个文件
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(write_one, splitter.sheets))
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _column_number(letters: str) -> int:
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def _cast_number(text: str) -> Union[int, float]:
+    # 与 openpyxl 一致：含小数点或指数的按浮点数处理
+    if "." in text or "E" in text or "e" in text:
+        return float(text)
+    return int(text)
+
+
+class XlsxReader:
+    """按需读取 xlsx 中的工作表列表和单元格，不加载整个工作簿
+
+    只读取 workbook.xml 等小部件；读取单元格时流式解析工作表 XML，
+    读到所需行之后立即停止；共享字符串表在第一次需要时才解析。
+    """
+
+    def __init__(self, xlsx_path: str):
+        self.xlsx_path = xlsx_path
+        self._zip = zipfile.ZipFile(xlsx_path)
+        names = set(self._zip.namelist())
+        small_parts = {PACKAGE_RELS_PART: self._zip.read(PACKAGE_RELS_PART)}
+        workbook_part = find_workbook_part(small_parts)
+        for part in (workbook_part, rels_part_for(workbook_part)):
+            small_parts[part] = self._zip.read(part)
+        self.sheets = [sheet for sheet in read_sheets(small_parts) if sheet.part in names]
+        self._shared_strings_part = next(
+            (
+                rel["part"]
+                for rel in read_relationships(small_parts, workbook_part)
+                if rel.get("Type", "").endswith("/sharedStrings") and rel["part"] in names
+            ),
+            None,
+        )
+        self._shared_strings: Optional[list[str]] = None
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def shared_strings(self) -> list[str]:
+        if self._shared_strings is None:
+            self._shared_strings = []
+            if self._shared_strings_part:
+                with self._zip.open(self._shared_strings_part) as f:
+                    for _, elem in iterparse(f):
+                        if _local_name(elem.tag) == "si":
+                            self._shared_strings.append(self._rich_text(elem))
+                            elem.clear()
+        return self._shared_strings
+
+    @staticmethod
+    def _rich_text(elem) -> str:
+        """<si> 或 <is> 中的文本，包括富文本片段，不包括注音（rPh）"""
+        texts = []
+        for child in elem:
+            name = _local_name(child.tag)
+            if name == "t":
+                texts.append(child.text or "")
+            elif name == "r":
+                texts.extend(t.text or "" for t in child if _local_name(t.tag) == "t")
+        return "".join(texts)
+
+    def read_range(self, sheet: SheetInfo, max_row: int, max_col: int) -> dict[tuple[int, int], CellValue]:
+        """读取工作表左上角 max_row 行 × max_col 列内的非空单元格
+
+        Returns:
+            {(行号, 列号): 值}，行列号从 1 开始
+        """
+        cells: dict[tuple[int, int], CellValue] = {}
+        row_number = 0
+        col_number = 0
+        with self._zip.open(sheet.part) as f:
+            for event, elem in iterparse(f, events=("start", "end")):
+                name = _local_name(elem.tag)
+                if event == "start":
+                    if name == "row":
+                        row_number = int(elem.get("r") or row_number + 1)
+                        col_number = 0
+                        if row_number > max_row:
+                            break
+                    continue
+                if name == "c":
+                    match = _CELL_REFERENCE.fullmatch(elem.get("r") or "")
+                    col_number = _column_number(match.group(1)) if match else col_number + 1
+                    if col_number <= max_col:
+                        value = self._cell_value(elem)
+                        if value is not None and value != "":
+                            cells[(row_number, col_number)] = value
+                elif name == "row":
+                    elem.clear()
+                elif name == "sheetData":
+                    break
+        return cells
+
+    def _cell_value(self, elem) -> CellValue:
+        cell_type = elem.get("t", "n")
+        if cell_type == "inlineStr":
+            inline = next((child for child in elem if _local_name(child.tag) == "is"), None)
+            return self._rich_text(inline) if inline is not None else None
+        value = next((child.text for child in elem if _local_name(child.tag) == "v"), None)
+        if value is None:
+            return None
+        if cell_type == "s":
+            return self.shared_strings()[int(value)]
+        if cell_type == "b":
+            return value == "1"
+        if cell_type == "n":
+            return _cast_number(value)
+        return value
+
+
+def validate_sheet_name(name: str) -> None:
+    """检查工作表名称是否符合 Excel 的要求，不符合时抛出 ValueError"""
+    if not name:
+        raise ValueError("工作表名称不能为空")
+    invalid = INVALID_SHEET_NAME_CHARS.search(name)
+    if invalid:
+        raise ValueError(f"工作表名称中有非法字符 {invalid.group(0)!r}: {name}")
+    if len(name) > MAX_SHEET_NAME_LENGTH:
+        raise ValueError(f"工作表名称超过 {MAX_SHEET_NAME_LENGTH} 个字符: {name}")
+
+
+def _rename_references(formula: str, renames: dict[str, str]) -> str:
+    """改写公式中引用了被重命名工作表的部分"""
+
+    def replace(match: re.Match) -> str:
+        quoted, plain = match.groups()
+        name = quoted.replace("''", "'") if quoted else plain
+        if name not in renames:
+            return match.group(0)
+        return "'{}'!".format(renames[name].replace("'", "''"))
+
+    return _SHEET_REFERENCE.sub(replace, formula)
+
+
+def rename_sheets(xlsx_path: str, output_path: str, renames: dict[str, str]) -> None:
+    """重命名工作表并写出到 output_path，不加载单元格和样式
+
+    只改写 workbook.xml（工作表名称和定义名称中的引用）和 docProps/app.xml（工作表标题列表），
+    其余部件逐块流式复制，内存占用与工作簿大小无关。
+    与 openpyxl 一样，单元格公式中对被重命名工作表的引用不会被改写。
+
+    Args:
+        xlsx_path: 源工作簿路径
+        output_path: 输出路径，可以与源文件相同
+        renames: {原名称: 新名称}
+    """
+    for new_name in renames.values():
+        validate_sheet_name(new_name)
+
+    with zipfile.ZipFile(xlsx_path) as zin:
+        small_parts = {PACKAGE_RELS_PART: zin.read(PACKAGE_RELS_PART)}
+        workbook_part = find_workbook_part(small_parts)
+        replacements = {workbook_part: _renamed_workbook(zin.read(workbook_part), renames)}
+        app_part = next(
+            (
+                rel["part"]
+                for rel in read_relationships(small_parts, "")
+                if rel.get("Type", "").endswith("/extended-properties") and rel["part"] in zin.NameToInfo
+            ),
+            None,
+        )
+        if app_part:
+            replacements[app_part] = _renamed_app_properties(zin.read(app_part), renames)
+
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename in replacements:
+                    zout.writestr(info.filename, replacements[info.filename], compress_type=zipfile.ZIP_DEFLATED)
+                    continue
+                out_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                out_info.compress_type = zipfile.ZIP_DEFLATED
+                out_info.external_attr = info.external_attr
+                with zin.open(info) as src, zout.open(out_info, "w", force_zip64=info.file_size > 0x7FFFFFFF) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(tmp_path, output_path)
+
+
+def _renamed_workbook(workbook_xml: bytes, renames: dict[str, str]) -> bytes:
+    def rename_sheet(match: re.Match) -> str:
+        element = match.group(0)
+        name = unescape(_attrs(element).get("name", ""))
+        if name not in renames:
+            return element
+        return re.sub(r'\bname="[^"]*"', lambda _: f'name="{escape(renames[name])}"', element, count=1)
+
+    def rename_defined_name(match: re.Match) -> str:
+        tag, attrs_text, value = match.groups()
+        formula = unescape(value)
+        renamed = _rename_references(formula, renames)
+        if renamed == formula:
+            return match.group(0)
+        return f"<{tag}{attrs_text}>{escape(renamed, quote=False)}</{tag}>"
+
+    text = _SHEET_ELEMENT.sub(rename_sheet, workbook_xml.decode("utf-8"))
+    text = _DEFINED_NAME.sub(rename_defined_name, text)
+    return text.encode("utf-8")
+
+
+def _renamed_app_properties(app_xml: bytes, renames: dict[str, str]) -> bytes:
+    def rename_title(match: re.Match) -> str:
+        start, title, end = match.groups()
+        new_title = renames.get(unescape(title))
+        return match.group(0) if new_title is None else f"{start}{escape(new_title, quote=False)}{end}"
+
+    text = _TITLES_OF_PARTS.sub(lambda m: _LPSTR.sub(rename_title, m.group(0)), app_xml.decode("utf-8"))
+    return text.encode("utf-8")